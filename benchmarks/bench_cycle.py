@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark full check_for_new_ads cycles against the local stub server.
+
+Seeds a throwaway database with N search URLs, each followed by M chats, then
+runs the real monitor through the stub proxy and measures two cycles:
+
+- cold: every ad is new (pagination, card parsing, detail fallbacks, outbox writes)
+- warm: nothing changed since the cold cycle (fingerprint short-circuit)
+
+Request pacing (REQUEST_RATE/REQUEST_BURST) is lifted so the numbers reflect
+the bot's own work rather than the deliberate delays; worker and per-host
+concurrency keep their configured values.
+
+Usage: python benchmarks/bench_cycle.py [--entries N] [--chats M] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from stub_server import StubServer
+
+def configure(stub: StubServer, db_path: str):
+    """Point the bot's configuration at the stub; must run before importing src modules."""
+    os.environ.update(
+        TELEGRAM_TOKEN="benchmark",
+        DATABASE_URL=f"sqlite:///{db_path}",
+        USE_PROXY="true",
+        PROXY_FALLBACK="false",
+        PROXY_LIST=f"127.0.0.1:{stub.port}",
+        PROXY_TEST_URL=f"{stub.base_url}/ip",
+        REQUEST_RATE="100000",
+        REQUEST_BURST="100000",
+        REQUEST_DELAY_MIN="0",
+        REQUEST_DELAY_MAX="0",
+        SEARCH_PAGE_CACHE_TTL="0",
+    )
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+async def run_cycle(stub: StubServer, urls: list[str]) -> dict:
+    from database import SessionLocal, Outbox
+    from scheduler import due_queue
+
+    before = stub.snapshot()
+    started_at = time.perf_counter()
+    for url in urls:
+        due_queue.schedule_now(url)
+    while due_queue.busy():
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - started_at
+    requests = stub.snapshot() - before
+
+    session = SessionLocal()
+    try:
+        outbox = session.query(Outbox).count()
+        session.query(Outbox).delete()
+        session.commit()
+    finally:
+        session.close()
+
+    return {
+        "seconds": round(elapsed, 4),
+        "search_requests": requests["search"],
+        "detail_requests": requests["detail"],
+        "requests": requests["search"] + requests["detail"],
+        "notifications": outbox,
+    }
+
+async def benchmark(stub: StubServer, entries: int, chats: int) -> dict:
+    from database import SessionLocal, Watchlist, async_engine
+    from proxy_manager import proxy_manager
+    from tasks import check_for_new_ads
+    from writer import db_writer
+    from registry import registry
+
+    urls = [stub.search_url(i) for i in range(entries)]
+    session = SessionLocal()
+    for url in urls:
+        for chat in range(chats):
+            session.add(Watchlist(chat_id=str(1000 + chat), url=url, title=url))
+    session.commit()
+    session.close()
+
+    await proxy_manager.check_proxies()
+    db_writer.start()
+    await registry.load()
+    monitor = asyncio.create_task(check_for_new_ads(3600))
+    try:
+        cold = await run_cycle(stub, urls)
+        warm = await run_cycle(stub, urls)
+    finally:
+        monitor.cancel()
+        await proxy_manager.aclose()
+        await db_writer.close()
+        await async_engine.dispose()
+
+    return {
+        "entries": entries,
+        "chats": chats,
+        "cold": cold,
+        "warm": warm,
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20, help="distinct search URLs")
+    parser.add_argument("--chats", type=int, default=3, help="chats following every search")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    stub = StubServer().start()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(stub, os.path.join(tmp, "bench.db"))
+        import logging
+        logging.basicConfig(level=logging.ERROR)
+        results = asyncio.run(benchmark(stub, args.entries, args.chats))
+    stub.stop()
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"📊 Monitoring cycle benchmark ({args.entries} searches x {args.chats} chats)")
+    print("=" * 72)
+    print(f"{'cycle':<6} {'seconds':>9} {'searches':>9} {'details':>8} {'requests':>9} {'notifications':>14}")
+    for name in ("cold", "warm"):
+        cycle = results[name]
+        print(f"{name:<6} {cycle['seconds']:>9.3f} {cycle['search_requests']:>9} {cycle['detail_requests']:>8} "
+              f"{cycle['requests']:>9} {cycle['notifications']:>14}")
+    print(f"max RSS: {results['max_rss_kib'] / 1024:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
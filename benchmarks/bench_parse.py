@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark the lxml extraction layer against the previous BeautifulSoup parsing.
+
+Reports CPU time and peak memory per page for the search and detail fixtures.
+Peak memory is the Python heap measured with tracemalloc; libxml2's own C
+allocations are not traced, for either parser.
+
+Usage: python benchmarks/bench_parse.py [iterations]
+"""
+
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from extract import parse_listings, parse_car_details
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+DETAIL_URL = "https://auto.mercadolibre.com.ar/MLA-1500000000-volkswagen-gol-trend-16-_JM"
+
+def bs4_parse_listings(html: str) -> list[str]:
+    """Search page parsing as it was done with BeautifulSoup."""
+    soup = BeautifulSoup(html, "lxml")
+    published_today = len(soup.find_all(string="Publicados hoy")) > 0
+    if published_today:
+        anchors = soup.select("a.poly-component__title")
+        return [a["href"].split("#")[0] for a in anchors if a.get("href")]
+    return []
+
+def bs4_parse_car_details(html: str, url: str) -> dict:
+    """Detail page parsing as it was done with BeautifulSoup."""
+    soup = BeautifulSoup(html, "lxml")
+
+    title = "Sin título"
+    title_tag = soup.find("title")
+    if title_tag:
+        title = title_tag.text.strip().replace(" | MercadoLibre", "")
+
+    price = "Precio no disponible"
+    price_elements = soup.select(".andes-money-amount__fraction")
+    if price_elements:
+        price = price_elements[0].text.strip()
+        currency_elements = soup.select(".andes-money-amount__currency-symbol")
+        if currency_elements:
+            price = f"{currency_elements[0].text.strip()} {price}"
+
+    year = "Año no disponible"
+    kilometers = "KM no disponible"
+    page_text = soup.get_text()
+    match = re.search(r"(\d{4})\s*\|\s*([\d.,]+)\s*km\s*·\s*Publicado", page_text)
+    if match:
+        year = match.group(1)
+        kilometers = match.group(2)
+
+    location = "Ubicación no disponible"
+    match = re.search(r'"city":"([^"]+)","neighborhood":"([^"]+)","state":"([^"]+)"', page_text)
+    if match:
+        location = f"{match.group(1)}, {match.group(3)}"
+
+    return {"title": title, "price": price, "year": year, "kilometers": kilometers, "location": location, "url": url}
+
+def measure(func, args, iterations: int) -> tuple:
+    """Return (CPU ms per call, peak KiB of one call, result)."""
+    result = func(*args)  # Warm up
+    started_at = time.process_time()
+    for _ in range(iterations):
+        func(*args)
+    cpu_ms = (time.process_time() - started_at) * 1000 / iterations
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu_ms, peak / 1024, result
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+def run(iterations: int) -> dict:
+    """Measure both parsers on every fixture; returns {page: {parser: {"cpu_ms", "peak_kib"}, "mismatches": [...]}}."""
+    search_html = load_fixture('search_page.html')
+    detail_html = load_fixture('detail_page.html')
+
+    cases = [
+        ("search page", bs4_parse_listings, parse_listings, (search_html,)),
+        ("detail page", bs4_parse_car_details, parse_car_details, (detail_html, DETAIL_URL)),
+    ]
+
+    results = {}
+    for name, legacy, current, args in cases:
+        legacy_ms, legacy_kib, legacy_result = measure(legacy, args, iterations)
+        current_ms, current_kib, current_result = measure(current, args, iterations)
+        mismatches = []
+        if isinstance(legacy_result, dict):
+            for field, value in legacy_result.items():
+                if value != current_result.get(field):
+                    mismatches.append(f"{field}: BeautifulSoup={value!r} lxml={current_result.get(field)!r}")
+        elif legacy_result != current_result:
+            mismatches.append(f"results differ: {len(legacy_result)} vs {len(current_result)} links")
+        results[name] = {
+            "BeautifulSoup": {"cpu_ms": legacy_ms, "peak_kib": legacy_kib},
+            "lxml/XPath": {"cpu_ms": current_ms, "peak_kib": current_kib},
+            "mismatches": mismatches,
+        }
+    return results
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    results = run(iterations)
+
+    print(f"📊 Parsing benchmark ({iterations} iterations)")
+    print("=" * 72)
+    print(f"{'page':<12} {'parser':<14} {'CPU ms/page':>12} {'peak KiB':>10} {'speedup':>9}")
+    for name, result in results.items():
+        legacy, current = result["BeautifulSoup"], result["lxml/XPath"]
+        print(f"{name:<12} {'BeautifulSoup':<14} {legacy['cpu_ms']:>12.2f} {legacy['peak_kib']:>10.0f}")
+        print(f"{'':<12} {'lxml/XPath':<14} {current['cpu_ms']:>12.2f} {current['peak_kib']:>10.0f} {legacy['cpu_ms'] / current['cpu_ms']:>8.1f}x")
+        for mismatch in result["mismatches"]:
+            print(f"   ⚠️  {mismatch}")
+
+if __name__ == "__main__":
+    main()
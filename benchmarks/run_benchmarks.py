@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Run the offline benchmark suite and compare it against the stored baseline.
+
+Collects parse time and memory per page (bench_parse.py) and full monitoring
+cycle time, requests and notifications (bench_cycle.py, in a subprocess so
+its memory is measured on its own). Exits with status 1 when a metric
+regresses past its tolerance:
+
+- times may grow by --time-tolerance (default 50%, they are machine dependent)
+- memory may grow by --memory-tolerance (default 25%)
+- request counts must not grow at all
+- notification counts must match exactly (they check correctness, not speed)
+
+Usage:
+    python benchmarks/run_benchmarks.py                     # compare with benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --update-baseline   # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import bench_parse
+from bench_parse import load_fixture, measure
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from extract import parse_search_page
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(BENCHMARKS, 'baseline.json')
+
+def collect(iterations: int, entries: int, chats: int) -> dict:
+    """Run every benchmark and return {metric: value} (lower is better, except notifications)."""
+    metrics = {}
+    for page, result in bench_parse.run(iterations).items():
+        key = page.replace(" ", "_")
+        metrics[f"parse.{key}.cpu_ms"] = result["lxml/XPath"]["cpu_ms"]
+        metrics[f"parse.{key}.peak_kib"] = result["lxml/XPath"]["peak_kib"]
+
+    search_html = load_fixture('search_page.html')
+    cpu_ms, peak_kib, _ = measure(parse_search_page, (search_html, "https://autos.mercadolibre.com.ar/"), iterations)
+    metrics["parse.search_page_cards.cpu_ms"] = cpu_ms
+    metrics["parse.search_page_cards.peak_kib"] = peak_kib
+
+    output = subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, 'bench_cycle.py'), '--json', '--entries', str(entries), '--chats', str(chats)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    cycle = json.loads(output.strip().splitlines()[-1])
+    for name in ("cold", "warm"):
+        for field, value in cycle[name].items():
+            metrics[f"cycle.{name}.{field}"] = value
+    metrics["cycle.max_rss_kib"] = cycle["max_rss_kib"]
+    return {metric: round(value, 3) for metric, value in metrics.items()}
+
+def tolerance(metric: str, args) -> tuple:
+    """(kind, allowed relative growth) for a metric."""
+    if metric.endswith("notifications"):
+        return "exact", 0.0
+    if metric.endswith("requests"):
+        return "count", 0.0
+    if metric.endswith("_kib"):
+        return "memory", args.memory_tolerance
+    return "time", args.time_tolerance
+
+def compare(metrics: dict, baseline: dict, args) -> list[str]:
+    """Return a description of every regression against the baseline."""
+    regressions = []
+    print(f"{'metric':<38} {'baseline':>12} {'current':>12} {'change':>9}")
+    for metric, value in metrics.items():
+        if metric not in baseline:
+            print(f"{metric:<38} {'-':>12} {value:>12.2f}")
+            continue
+        expected = baseline[metric]
+        kind, allowed = tolerance(metric, args)
+        change = (value - expected) / expected if expected else 0.0
+        if kind == "exact":
+            regressed = value != expected
+        else:
+            regressed = value > expected * (1 + allowed) if expected else value > 0
+        marker = "❌" if regressed else ""
+        print(f"{metric:<38} {expected:>12.2f} {value:>12.2f} {change:>+8.0%} {marker}")
+        if regressed:
+            regressions.append(f"{metric}: {expected} -> {value} ({kind}, {allowed:.0%} allowed)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite with regression checks")
+    parser.add_argument("--iterations", type=int, default=20, help="parse iterations per page")
+    parser.add_argument("--entries", type=int, default=20, help="distinct search URLs in the cycle benchmark")
+    parser.add_argument("--chats", type=int, default=3, help="chats following every search")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="allowed relative growth of times")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="allowed relative growth of memory")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    params = {"iterations": args.iterations, "entries": args.entries, "chats": args.chats}
+    print(f"📊 Running benchmarks ({args.entries} searches x {args.chats} chats, {args.iterations} parse iterations)")
+    metrics = collect(args.iterations, args.entries, args.chats)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({"params": params, "metrics": metrics}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"✅ Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"❌ No baseline at {args.baseline}, run with --update-baseline first")
+        sys.exit(1)
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline["params"] != params:
+        print(f"❌ Baseline was recorded with {baseline['params']}, not {params}")
+        sys.exit(1)
+
+    regressions = compare(metrics, baseline["metrics"], args)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"   {regression}")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+if __name__ == "__main__":
+    main()
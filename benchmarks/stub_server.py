@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for MercadoLibre and the proxies, serving the recorded fixtures.
+
+Search URLs look like /search<N>/_PublishedToday_YES. Every search gets its own
+item IDs so searches don't share ads, and every result page (_Desde_N) shifts
+them again. Each search has `pages_per_search` pages; the last one has no
+"Siguiente" link. Every `missing_location_every`-th card has no location, so the
+monitor falls back to the detail page for it. Any /MLA-... path serves the
+detail page fixture and /ip answers proxy health checks.
+
+The same server also acts as an HTTP proxy: requests in absolute form
+("GET http://127.0.0.1:port/...") are served directly and counted as proxied.
+
+Usage: python benchmarks/stub_server.py [port]
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+RESULTS_PER_PAGE = 48
+
+ITEM_ID_REGEX = re.compile(r"(MLA-?)(\d+)")
+DESDE_REGEX = re.compile(r"_Desde_(\d+)")
+SEARCH_REGEX = re.compile(r"^/search(\d+)/")
+NEXT_LINK_REGEX = re.compile(r'<li class="andes-pagination__button andes-pagination__button--next">.*?</li>')
+CARD_REGEX = re.compile(r'<li class="ui-search-layout__item">')
+LOCATION_REGEX = re.compile(r'<span class="poly-component__location">[^<]*</span>')
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+class StubServer:
+    """Threaded stub server; `counts` tallies requests by kind ("search", "detail", "proxy_check", "proxied")."""
+
+    def __init__(self, port: int = 0, pages_per_search: int = 2, missing_location_every: int = 8):
+        self.pages_per_search = pages_per_search
+        self.missing_location_every = missing_location_every
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._search_html = load_fixture('search_page.html')
+        self._detail_html = load_fixture('detail_page.html').encode('utf-8')
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_port
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def count(self, kind: str):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.counts)
+
+    def search_url(self, index: int) -> str:
+        return f"{self.base_url}/search{index}/_PublishedToday_YES"
+
+    def render_search_page(self, index: int, start: int) -> bytes:
+        offset = index * 1_000_000 + start
+        html = ITEM_ID_REGEX.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + offset}", self._search_html)
+        html = html.replace("https://auto.mercadolibre.com.ar", self.base_url)
+
+        # Drop the location from every n-th card
+        cards = CARD_REGEX.split(html)
+        for i in range(1, len(cards)):
+            if self.missing_location_every and i % self.missing_location_every == 0:
+                cards[i] = LOCATION_REGEX.sub("", cards[i])
+        html = '<li class="ui-search-layout__item">'.join(cards)
+
+        next_start = start + RESULTS_PER_PAGE
+        if next_start // RESULTS_PER_PAGE < self.pages_per_search:
+            next_link = (
+                '<li class="andes-pagination__button andes-pagination__button--next">'
+                f'<a class="andes-pagination__link" href="{self.base_url}/search{index}/_Desde_{next_start + 1}_PublishedToday_YES" title="Siguiente">Siguiente</a></li>'
+            )
+            html = NEXT_LINK_REGEX.sub(next_link, html)
+        else:
+            html = NEXT_LINK_REGEX.sub("", html)
+        return html.encode('utf-8')
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: bytes, content_type: str = "text/html; charset=utf-8"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # Absolute-form request line: we are being used as a proxy
+                if self.path.startswith("http://"):
+                    server.count("proxied")
+                path = urlparse(self.path).path
+
+                if path == "/ip":
+                    server.count("proxy_check")
+                    self._reply(200, b'{"origin": "127.0.0.1"}', "application/json")
+                elif path.startswith("/MLA-"):
+                    server.count("detail")
+                    self._reply(200, server._detail_html)
+                elif match := SEARCH_REGEX.match(path):
+                    server.count("search")
+                    desde = DESDE_REGEX.search(path)
+                    start = int(desde.group(1)) - 1 if desde else 0
+                    self._reply(200, server.render_search_page(int(match.group(1)), start))
+                else:
+                    self._reply(404, b"")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+if __name__ == "__main__":
+    stub = StubServer(int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print(f"🧪 Stub MercadoLibre/proxy server on {stub.base_url} (e.g. {stub.search_url(0)})")
+    stub._httpd.serve_forever()
@@ -5,12 +5,13 @@ Script to show current proxy status and configuration.
 
 import sys
 import os
+import asyncio
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from proxy_manager import proxy_manager
-from config import USE_PROXY, PROXY_UPDATE_INTERVAL, PROXY_MAX_RETRIES, PROXY_TIMEOUT, PROXY_FALLBACK
+from config import USE_PROXY, PROXY_UPDATE_INTERVAL, PROXY_MAX_RETRIES, PROXY_TIMEOUT, PROXY_FALLBACK, PROXY_TEST_URL
 
 def main():
     """Show proxy status and configuration."""
@@ -23,15 +24,19 @@ def main():
     print(f"Update Interval: {PROXY_UPDATE_INTERVAL} seconds")
     print(f"Max Retries: {PROXY_MAX_RETRIES}")
     print(f"Timeout: {PROXY_TIMEOUT} seconds")
+    print(f"Health Check URL: {PROXY_TEST_URL}")
+    
+    # Run one health check so the scored pool is populated
+    asyncio.run(proxy_manager.check_proxies())
     
     print("\n📊 Current Proxy Status:")
     print(f"Total Proxies: {len(proxy_manager.proxies)}")
-    print(f"Current Index: {proxy_manager.current_proxy_index}")
+    print(f"Healthy Proxies: {sum(1 for stats in proxy_manager.stats.values() if stats.healthy)}")
     
     if proxy_manager.proxies:
-        print("\n🌐 Available Proxies:")
-        for i, proxy in enumerate(proxy_manager.proxies[:5]):  # Show first 5
-            print(f"  {i+1}. {proxy['http']}")
+        print("\n🌐 Available Proxies (best first):")
+        for i, (proxy, score) in enumerate(proxy_manager.ranked_proxies()[:5]):  # Show first 5
+            print(f"  {i+1}. {proxy['http']} (score {score:.2f})")
         if len(proxy_manager.proxies) > 5:
             print(f"  ... and {len(proxy_manager.proxies) - 5} more")
     else:
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from proxy_manager import proxy_manager
+from scheduler import host_limiter
+from scraper import HEADERS, car_details_error, transform_listado_to_autos
+from cache import search_page_cache
+from extract import parse_car_details, parse_search_page, results_fingerprint
+from metrics import stage_seconds
+
+logger = logging.getLogger(__name__)
+
+# Awaitable versions of the scraper functions. They share the extraction
+# layer with scraper.py but never block the event loop: pacing goes through the
+# per-host token buckets, requests use httpx and HTML parsing runs in a
+# worker thread.
+
+@dataclass
+class SearchPage:
+    """Result of fetching a search page: its listings, title and result metadata."""
+    url: str
+    changed: bool
+    ads: list[str] = field(default_factory=list)
+    cards: dict[str, dict] = field(default_factory=dict)  # Car fields parsed from each ad's result card
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fingerprint: Optional[str] = None
+    next_url: Optional[str] = None
+    title: Optional[str] = None
+    result_count: Optional[int] = None
+
+async def _fetch(url: str, timeout: int, headers: dict = HEADERS):
+    """Fetch a page through the proxy manager, paced by the host limiter."""
+    async with host_limiter.slot(url):
+        return await proxy_manager.make_async_request_with_proxy(url, headers=headers, timeout=timeout)
+
+async def get_listings(url: str, cards: bool = False) -> list:
+    """Ad links of a search page, or its parsed listing cards (dicts of car fields) with `cards=True`."""
+    page = await fetch_search_page(url)
+    if page is None:
+        return []
+    return list(page.cards.values()) if cards else page.ads
+
+async def _parse_search_page(url: str, res) -> SearchPage:
+    with stage_seconds.time(stage="parse"):
+        parsed = await asyncio.to_thread(parse_search_page, res.text, url)
+    return SearchPage(
+        url,
+        changed=True,
+        ads=parsed["ads"],
+        cards=parsed["cards"],
+        etag=res.headers.get("ETag"),
+        last_modified=res.headers.get("Last-Modified"),
+        fingerprint=results_fingerprint(res.text),
+        next_url=parsed["next_url"],
+        title=parsed["title"],
+        result_count=parsed["result_count"],
+    )
+
+async def _download_search_page(url: str) -> Optional[SearchPage]:
+    """Fetch and fully parse a search page, or return None if it couldn't be fetched."""
+    try:
+        res = await _fetch(url, timeout=15)
+        if res is None:
+            logger.error(f"Failed to fetch URL {url} with proxy")
+            return None
+    except Exception as e:
+        logger.error(f"Failed to fetch URL {url}: {e}")
+        return None
+    return await _parse_search_page(url, res)
+
+def _compare(page: SearchPage, fingerprint: Optional[str]) -> SearchPage:
+    """Copy of a shared page, marked unchanged if it matches the caller's fingerprint."""
+    page = replace(page)
+    if fingerprint and page.fingerprint == fingerprint:
+        logger.debug(f"Search results unchanged: {page.url}")
+        page.changed = False
+    return page
+
+async def fetch_search_page(url: str, etag: str = None, last_modified: str = None, fingerprint: str = None) -> Optional[SearchPage]:
+    """Fetch a search page, skipping all parsing when it hasn't changed.
+
+    A page fetched moments ago (see SEARCH_PAGE_CACHE_TTL) is reused instead
+    of downloading it again, and concurrent fetches of the same URL without
+    any stored state (title lookups, first checks) share one request.
+    Otherwise the stored validators are sent as a conditional request; on
+    304, or when the raw result set hashes to the stored fingerprint, the
+    page is reported as unchanged and never parsed. Returns None if the page
+    couldn't be fetched.
+    """
+    url = transform_listado_to_autos(url)
+
+    cached = search_page_cache.peek(url)
+    if cached is not None:
+        return _compare(cached, fingerprint)
+    if not (etag or last_modified or fingerprint):
+        page = await search_page_cache.get(url, _download_search_page)
+        return _compare(page, fingerprint) if page is not None else None
+
+    headers = dict(HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    try:
+        res = await _fetch(url, timeout=15, headers=headers)
+        if res is None:
+            logger.error(f"Failed to fetch URL {url} with proxy")
+            return None
+    except Exception as e:
+        logger.error(f"Failed to fetch URL {url}: {e}")
+        return None
+
+    if res.status_code == 304:
+        logger.debug(f"Search page not modified: {url}")
+        return SearchPage(url, changed=False, etag=etag, last_modified=last_modified, fingerprint=fingerprint)
+
+    if fingerprint and results_fingerprint(res.text) == fingerprint:
+        logger.debug(f"Search results unchanged: {url}")
+        return SearchPage(
+            url,
+            changed=False,
+            etag=res.headers.get("ETag"),
+            last_modified=res.headers.get("Last-Modified"),
+            fingerprint=fingerprint,
+        )
+
+    page = await _parse_search_page(url, res)
+    search_page_cache.put(url, page)
+    return replace(page)
+
+async def get_title_from_url(url: str) -> str:
+    """Title of a search page, sharing the fetch with the search's first check."""
+    page = await fetch_search_page(url)
+    if page is None:
+        logger.warning(f"Failed to fetch title for {url}")
+        return url
+    return page.title or url
+
+async def get_car_details(url: str) -> dict:
+    """Extract detailed car information from a MercadoLibre car listing page."""
+    # Transform listado URLs to autos URLs
+    url = transform_listado_to_autos(url)
+
+    try:
+        res = await _fetch(url, timeout=15)
+        if res is None:
+            logger.error(f"Failed to fetch car details from {url} with proxy")
+            return car_details_error(url)
+    except Exception as e:
+        logger.error(f"Failed to fetch car details from {url}: {e}")
+        return car_details_error(url)
+
+    with stage_seconds.time(stage="parse"):
+        return await asyncio.to_thread(parse_car_details, res.text, url)
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, select
+
+from database import AsyncSessionLocal, DetailCache
+from writer import db_writer
+from metrics import cache_requests_total
+from config import DETAIL_CACHE_TTL, DETAIL_CACHE_SIZE, SEARCH_PAGE_CACHE_TTL
+from scraper import CAR_DETAILS_ERROR_TITLE
+
+logger = logging.getLogger(__name__)
+
+class ListingDetailCache:
+    """TTL + LRU cache of car details keyed by ad URL, persisted in the database.
+
+    Concurrent lookups for the same URL share a single fetch, so every chat
+    that needs a listing is served from one detail-page request.
+    """
+
+    def __init__(self, ttl: int = DETAIL_CACHE_TTL, max_size: int = DETAIL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._loaded = False
+
+    async def _load(self):
+        """Load the still-valid entries persisted by previous runs."""
+        self._loaded = True
+        cutoff = time.time() - self.ttl
+        await db_writer.write(lambda session: session.execute(delete(DetailCache).where(DetailCache.fetched_at < cutoff)))
+        async with AsyncSessionLocal() as session:
+            rows = (
+                await session.scalars(
+                    select(DetailCache)
+                    .order_by(DetailCache.fetched_at.desc())
+                    .limit(self.max_size)
+                )
+            ).all()
+            # Oldest first so the most recent fetches are the last to be evicted
+            for row in reversed(rows):
+                self._entries.setdefault(row.url, (row.fetched_at, json.loads(row.data)))
+        logger.info(f"Loaded {len(self._entries)} cached listing details")
+
+    def _store(self, url: str, details: dict):
+        fetched_at = time.time()
+        self._entries[url] = (fetched_at, details)
+        self._entries.move_to_end(url)
+
+        evicted = []
+        while len(self._entries) > self.max_size:
+            evicted_url, _ = self._entries.popitem(last=False)
+            evicted.append(evicted_url)
+
+        async def persist(session):
+            await session.merge(DetailCache(url=url, data=json.dumps(details), fetched_at=fetched_at))
+            if evicted:
+                await session.execute(delete(DetailCache).where(DetailCache.url.in_(evicted)))
+        
+        def persisted(future):
+            if future.exception():
+                logger.warning(f"Failed to persist cached details for {url}: {future.exception()}")
+
+        # Persisting is best effort, don't hold the check up waiting for the commit
+        db_writer.submit(persist).add_done_callback(persisted)
+
+    async def _fetch(self, url: str, fetch: Callable[[str], Awaitable[dict]]) -> dict:
+        try:
+            details = await fetch(url)
+            # Don't cache failed fetches, the next chat should try again
+            if details.get("title") != CAR_DETAILS_ERROR_TITLE:
+                self._store(url, details)
+            return details
+        finally:
+            self._inflight.pop(url, None)
+
+    async def get(self, url: str, fetch: Callable[[str], Awaitable[dict]]) -> dict:
+        """Return the cached details for `url`, calling `fetch` on a miss."""
+        if not self._loaded:
+            await self._load()
+
+        cached = self._entries.get(url)
+        if cached and time.time() - cached[0] < self.ttl:
+            self.hits += 1
+            self._entries.move_to_end(url)
+            return cached[1]
+
+        if url in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[url])
+
+        self.misses += 1
+        task = asyncio.create_task(self._fetch(url, fetch))
+        self._inflight[url] = task
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+class SearchPageCache:
+    """Short-lived in-memory cache of parsed search pages keyed by URL.
+
+    Lets requests for the same search made moments apart (e.g. resolving a new
+    URL's title and its first check) share one download and parse.
+    """
+
+    def __init__(self, ttl: int = SEARCH_PAGE_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, tuple[float, Any]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _fresh(self, url: str) -> Optional[Any]:
+        cached = self._entries.get(url)
+        if cached and time.time() - cached[0] < self.ttl:
+            return cached[1]
+        return None
+
+    def peek(self, url: str) -> Optional[Any]:
+        """Return the cached page for `url` if it's still fresh, without fetching."""
+        page = self._fresh(url)
+        if page is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def put(self, url: str, page: Any):
+        now = time.time()
+        for expired in [key for key, (fetched_at, _) in self._entries.items() if now - fetched_at >= self.ttl]:
+            del self._entries[expired]
+        self._entries[url] = (now, page)
+
+    async def _fetch(self, url: str, fetch: Callable[[str], Awaitable[Any]]) -> Any:
+        try:
+            page = await fetch(url)
+            if page is not None:
+                self.put(url, page)
+            return page
+        finally:
+            self._inflight.pop(url, None)
+
+    async def get(self, url: str, fetch: Callable[[str], Awaitable[Any]]) -> Any:
+        """Return the fresh cached page for `url`, or join/start a fetch for it."""
+        cached = self._fresh(url)
+        if cached is not None:
+            return cached
+        if url not in self._inflight:
+            self._inflight[url] = asyncio.create_task(self._fetch(url, fetch))
+        return await asyncio.shield(self._inflight[url])
+
+# Global cache shared by every search and chat
+detail_cache = ListingDetailCache()
+
+# Global cache of recently fetched search pages
+search_page_cache = SearchPageCache()
+
+for name, cache in (("detail", detail_cache), ("search_page", search_page_cache)):
+    cache_requests_total.track(lambda cache=cache: cache.hits, cache=name, result="hit")
+    cache_requests_total.track(lambda cache=cache: cache.misses, cache=name, result="miss")
@@ -0,0 +1,130 @@
+import random
+import time
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_BASE_BACKOFF, BREAKER_MAX_BACKOFF, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+logger = logging.getLogger(__name__)
+
+TRIAL_TIMEOUT = 120  # A half-open trial that never reported back is given up after this long (seconds)
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Exponential backoff with full jitter for the given (zero-based) attempt."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """Stops traffic to a failing endpoint (a proxy or a target host) for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens for an
+    exponentially growing, jittered period. Once it elapses a single trial
+    request is let through (half-open): `allow` turns everyone else away until
+    the trial records a success, which closes the circuit, or a failure, which
+    reopens it for longer. A Retry-After from the server opens it for exactly
+    that long.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 base_backoff: float = BREAKER_BASE_BACKOFF, max_backoff: float = BREAKER_MAX_BACKOFF):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_started_at: Optional[float] = None
+
+    def _trial_in_flight(self, now: float) -> bool:
+        return self.trial_started_at is not None and now - self.trial_started_at < TRIAL_TIMEOUT
+
+    def ready(self) -> bool:
+        """Whether `allow` would let a request through, without claiming the half-open trial."""
+        now = time.time()
+        if now < self.open_until:
+            return False
+        return self.failures < self.failure_threshold or not self._trial_in_flight(now)
+
+    def allow(self) -> bool:
+        """Whether a request may be made now; in the half-open state, the caller gets the only trial."""
+        if not self.ready():
+            return False
+        if self.failures >= self.failure_threshold:
+            self.trial_started_at = time.time()
+        return True
+
+    def release(self):
+        """Give the trial back without a verdict, e.g. when the request failed for an unrelated reason."""
+        self.trial_started_at = None
+
+    def remaining(self) -> float:
+        return max(0.0, self.open_until - time.time())
+
+    @property
+    def state(self) -> str:
+        if time.time() < self.open_until:
+            return "open"
+        return "half-open" if self.failures >= self.failure_threshold else "closed"
+
+    def record_success(self):
+        if self.failures >= self.failure_threshold:
+            logger.info(f"Circuit closed for {self.name}")
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_started_at = None
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        self.failures += 1
+        self.trial_started_at = None
+        if retry_after is not None:
+            backoff = min(retry_after, self.max_backoff)
+        elif self.failures >= self.failure_threshold:
+            exponent = self.failures - self.failure_threshold
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** exponent)
+            backoff = random.uniform(backoff / 2, backoff)
+        else:
+            return
+        self.open_until = max(self.open_until, time.time() + backoff)
+        logger.warning(f"Circuit open for {self.name} for {backoff:.0f} seconds ({self.failures} consecutive failures)")
+
+class BreakerRegistry:
+    """Lazily creates one circuit breaker per name (e.g. "host:..." or "proxy:...")."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(name)
+        return self._breakers[name]
+
+    def for_host(self, url: str) -> CircuitBreaker:
+        return self.get(f"host:{urlparse(url).netloc}")
+
+    def for_proxy(self, proxy_url: str) -> CircuitBreaker:
+        return self.get(f"proxy:{proxy_url}")
+
+    def retain_proxies(self, proxy_urls):
+        """Drop the breakers of proxies not in `proxy_urls` (e.g. ones that left the proxy pool)."""
+        names = {f"proxy:{proxy_url}" for proxy_url in proxy_urls}
+        for name in [name for name in self._breakers if name.startswith("proxy:") and name not in names]:
+            del self._breakers[name]
+
+    def all(self) -> Dict[str, CircuitBreaker]:
+        return dict(self._breakers)
+
+# Global registry shared by the proxy manager and the scheduler
+breakers = BreakerRegistry()
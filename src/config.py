@@ -5,15 +5,75 @@ load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "300"))
+
+# Adaptive polling configuration (each search's interval moves within these bounds)
+MIN_CHECK_INTERVAL = int(os.getenv("MIN_CHECK_INTERVAL", "60"))  # Shortest interval for busy searches (seconds)
+MAX_CHECK_INTERVAL = int(os.getenv("MAX_CHECK_INTERVAL", "1800"))  # Longest interval for quiet searches (seconds)
+TARGET_NEW_ADS_PER_CHECK = float(os.getenv("TARGET_NEW_ADS_PER_CHECK", "1"))  # New ads a check should find on average
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # Pooled connections per engine (server databases only)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # Extra connections allowed above the pool size under load
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # How long a SQLite write waits for a lock (milliseconds)
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.02"))  # How long the database writer gathers writes before committing them (seconds)
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))  # Most writes committed in one transaction
 
 # Rate limiting configuration for MercadoLibre requests
-REQUEST_DELAY_MIN = int(os.getenv("REQUEST_DELAY_MIN", "3"))  # Minimum delay between requests (seconds)
-REQUEST_DELAY_MAX = int(os.getenv("REQUEST_DELAY_MAX", "8"))  # Maximum delay between requests (seconds)
+REQUEST_DELAY_MIN = int(os.getenv("REQUEST_DELAY_MIN", "3"))  # Minimum delay between requests of the sync scraper (test scripts, seconds)
+REQUEST_DELAY_MAX = int(os.getenv("REQUEST_DELAY_MAX", "8"))  # Maximum delay between requests of the sync scraper (test scripts, seconds)
+
+# Monitoring scheduler configuration
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "4"))  # Watchlist entries checked concurrently
+HOST_CONCURRENCY = int(os.getenv("HOST_CONCURRENCY", "2"))  # Maximum in-flight requests per host
+REQUEST_RATE = float(os.getenv("REQUEST_RATE", "0.5"))  # Sustained requests per second per host (token refill rate)
+REQUEST_BURST = int(os.getenv("REQUEST_BURST", "3"))  # Requests per host allowed in a burst (token bucket size)
+SEARCH_MAX_PAGES = int(os.getenv("SEARCH_MAX_PAGES", "5"))  # Most result pages fetched per check, resumed crawls included
+
+# Process roles and sharded monitoring configuration
+BOT_ROLE = os.getenv("BOT_ROLE", "all").lower()  # "all" (bot + monitor), "frontend" (Telegram bot and delivery) or "worker" (monitor only)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))  # Monitoring processes started by a "worker" role
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "16"))  # Shards the search URLs are split into between workers
+LEASE_TTL = int(os.getenv("LEASE_TTL", "60"))  # Seconds before a silent worker's shards can be taken over
+
+# Metrics endpoint configuration
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Interface the Prometheus metrics endpoint listens on
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # Port of the bot's /metrics endpoint, worker N uses METRICS_PORT + 1 + N (0 disables it)
+
+# Seen ads retention configuration
+SEEN_AD_RETENTION_DAYS = int(os.getenv("SEEN_AD_RETENTION_DAYS", "7"))  # Seen ads older than this are deleted (days)
+SEEN_AD_PURGE_INTERVAL = int(os.getenv("SEEN_AD_PURGE_INTERVAL", "86400"))  # How often the retention job runs (seconds)
+
+# Listing detail cache configuration
+DETAIL_CACHE_TTL = int(os.getenv("DETAIL_CACHE_TTL", "21600"))  # How long fetched car details stay valid (seconds)
+DETAIL_CACHE_SIZE = int(os.getenv("DETAIL_CACHE_SIZE", "5000"))  # Maximum number of cached listings (LRU eviction)
+SEARCH_PAGE_CACHE_TTL = int(os.getenv("SEARCH_PAGE_CACHE_TTL", "60"))  # How long a fetched search page is shared between callers (seconds)
+
+# Telegram delivery configuration
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # Messages per second across all chats
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # Messages per second to a single chat
+DIGEST_MAX_ADS = int(os.getenv("DIGEST_MAX_ADS", "10"))  # Most ads merged into one digest message
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "5"))  # Retries for a message hitting flood limits or network errors
+OUTBOX_POLL_INTERVAL = int(os.getenv("OUTBOX_POLL_INTERVAL", "5"))  # How often the outbox is re-read for messages from workers and retries (seconds)
 
 # Proxy configuration
 USE_PROXY = os.getenv("USE_PROXY", "true").lower() == "true"  # Enable/disable proxy usage
 PROXY_UPDATE_INTERVAL = int(os.getenv("PROXY_UPDATE_INTERVAL", "300"))  # Proxy list update interval (seconds)
 PROXY_MAX_RETRIES = int(os.getenv("PROXY_MAX_RETRIES", "3"))  # Maximum retries for proxy requests
 PROXY_TIMEOUT = int(os.getenv("PROXY_TIMEOUT", "10"))  # Proxy request timeout (seconds)
-PROXY_FALLBACK = os.getenv("PROXY_FALLBACK", "true").lower() == "true"  # Enable/disable fallback to direct connection
\ No newline at end of file
+PROXY_FALLBACK = os.getenv("PROXY_FALLBACK", "true").lower() == "true"  # Enable/disable fallback to direct connection
+PROXY_LIST = [proxy.strip() for proxy in os.getenv("PROXY_LIST", "").split(",") if proxy.strip()]  # Fixed proxies (host:port or URL) used instead of the free proxy lists
+PROXY_TEST_URL = os.getenv("PROXY_TEST_URL", "https://httpbin.org/ip")  # URL used to health-check proxies
+PROXY_HEALTH_CHECK_INTERVAL = int(os.getenv("PROXY_HEALTH_CHECK_INTERVAL", "60"))  # Background proxy health check interval (seconds)
+PROXY_HEALTH_CHECK_CONCURRENCY = int(os.getenv("PROXY_HEALTH_CHECK_CONCURRENCY", "20"))  # Proxies probed at once during a health check
+PROXY_POOL_SIZE = int(os.getenv("PROXY_POOL_SIZE", "20"))  # Best healthy proxies kept in the pool and rotated through
+PROXY_CHECK_SAMPLE = int(os.getenv("PROXY_CHECK_SAMPLE", "50"))  # Untried proxies from the list probed per health check while the pool is short
+
+# Circuit breaker and retry backoff configuration
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))  # Consecutive failures before a proxy/host circuit opens
+BREAKER_BASE_BACKOFF = float(os.getenv("BREAKER_BASE_BACKOFF", "30"))  # First open period, doubled on each further failure (seconds)
+BREAKER_MAX_BACKOFF = float(os.getenv("BREAKER_MAX_BACKOFF", "900"))  # Longest open period, also caps Retry-After (seconds)
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))  # Base delay between request retries (seconds)
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))  # Maximum delay between request retries (seconds)
+
+# HTTP connection pooling configuration
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))  # Maximum pooled connections per proxy (and for direct mode)
+HTTP_POOL_IDLE_TIMEOUT = int(os.getenv("HTTP_POOL_IDLE_TIMEOUT", "120"))  # Close pooled clients unused for this long (seconds)
\ No newline at end of file
@@ -1,13 +1,54 @@
-from sqlalchemy import Column, Integer, String, Text, UniqueConstraint, create_engine, text, Boolean
+import time
+import logging
+
+from sqlalchemy import Column, Integer, BigInteger, String, Text, UniqueConstraint, ForeignKey, create_engine, delete, event, text, inspect, Boolean, Float
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
-from config import DATABASE_URL
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, SQLITE_BUSY_TIMEOUT
+from scraper import ad_hash
+
+logger = logging.getLogger(__name__)
+
+# Async drivers for the event loop, by backend (the sync engine keeps the default ones)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with the backend's async driver, unless it already names one."""
+    backend, separator, rest = url.partition("://")
+    if "+" in backend or backend not in ASYNC_DRIVERS:
+        return url
+    return f"{ASYNC_DRIVERS[backend]}{separator}{rest}"
+
+def _engine_options(url: str) -> dict:
+    # SQLite connections are cheap and local, pool sizing only applies to server databases
+    if url.startswith("sqlite"):
+        return {}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True, "pool_recycle": 1800}
+
+SQLITE_AUTO_VACUUM_INCREMENTAL = 2  # PRAGMA auto_vacuum value of the incremental mode
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    """Per-connection SQLite tuning: WAL lets readers run during writes, busy_timeout waits out writer locks."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.close()
 
-engine = create_engine(DATABASE_URL, echo=False, future=True)
-with engine.connect() as conn:
-    conn.execute(text("PRAGMA journal_mode=WAL"))
+engine = create_engine(DATABASE_URL, echo=False, future=True, **_engine_options(DATABASE_URL))
+async_engine = create_async_engine(async_database_url(DATABASE_URL), echo=False, **_engine_options(DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _tune_sqlite)
+    event.listen(async_engine.sync_engine, "connect", _tune_sqlite)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+# For code running on the event loop (handlers, monitor); SessionLocal is for worker threads and scripts
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class Watchlist(Base):
@@ -20,11 +61,10 @@ class Watchlist(Base):
 
 class SeenAd(Base):
     __tablename__ = "seen_ads"
-    id = Column(Integer, primary_key=True)
-    chat_id = Column(String, index=True)
-    url = Column(Text, nullable=False)
-    ad_link = Column(Text, nullable=False)
-    __table_args__ = (UniqueConstraint("chat_id", "url", "ad_link", name="uq_chat_url_adlink"),)
+    watchlist_id = Column(Integer, ForeignKey("watchlist.id", ondelete="CASCADE"), primary_key=True)
+    item_hash = Column(BigInteger, primary_key=True)  # ad_hash() of the MercadoLibre item ID
+    seen_at = Column(Integer, nullable=False)  # Unix timestamp, used for retention
+    __table_args__ = {"sqlite_with_rowid": False}
 
 class BotState(Base):
     __tablename__ = "bot_state"
@@ -32,4 +72,118 @@ class BotState(Base):
     chat_id = Column(String, unique=True, index=True)
     is_running = Column(Boolean, default=True)  # True = running, False = stopped
 
-Base.metadata.create_all(engine)
\ No newline at end of file
+class DetailCache(Base):
+    __tablename__ = "detail_cache"
+    url = Column(Text, primary_key=True)
+    data = Column(Text, nullable=False)  # JSON-encoded car details
+    fetched_at = Column(Float, nullable=False, index=True)  # Unix timestamp of the detail page fetch
+
+class SearchState(Base):
+    __tablename__ = "search_state"
+    url = Column(Text, primary_key=True)
+    etag = Column(Text, nullable=True)  # ETag of the last processed response
+    last_modified = Column(Text, nullable=True)  # Last-Modified of the last processed response
+    fingerprint = Column(String(32), nullable=True)  # results_fingerprint() of the last processed page
+
+class SearchGeneration(Base):
+    __tablename__ = "search_generation"
+    url = Column(Text, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)  # Bumped whenever the search's stored state is invalidated
+
+class SearchSchedule(Base):
+    __tablename__ = "search_schedule"
+    url = Column(Text, primary_key=True)
+    interval = Column(Float, nullable=False)  # Current polling interval (seconds)
+    rate = Column(Float, nullable=False, default=0.0)  # Smoothed new ads per hour
+    hourly = Column(Text, nullable=False)  # JSON list of smoothed new ads per hour for each UTC hour of the day
+    last_checked_at = Column(Float, nullable=True)  # Unix timestamp of the last successful check
+    next_due_at = Column(Float, nullable=False)  # Unix timestamp of the next check
+
+class Outbox(Base):
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True)  # Delivery order
+    chat_id = Column(String, nullable=False, index=True)
+    text = Column(Text, nullable=False)  # Formatted ad message
+    created_at = Column(Integer, nullable=False)  # Unix timestamp of the check that found the ad
+    attempts = Column(Integer, nullable=False, default=0)  # Failed delivery rounds so far
+    next_attempt_at = Column(Float, nullable=False, default=0.0)  # Unix timestamp before which it isn't retried
+
+class ShardLease(Base):
+    __tablename__ = "shard_lease"
+    shard = Column(Integer, primary_key=True)  # sharding.shard_of() of the search URLs it covers
+    owner = Column(String, nullable=True)  # Worker holding the lease, None if free
+    expires_at = Column(Float, nullable=False, default=0.0)  # Unix timestamp after which other workers may claim it
+
+class WorkerHeartbeat(Base):
+    __tablename__ = "worker_heartbeat"
+    worker_id = Column(String, primary_key=True)  # "host:pid" of a monitoring worker
+    seen_at = Column(Float, nullable=False)  # Unix timestamp of its last lease refresh
+
+def _enable_incremental_vacuum():
+    """Switch SQLite to incremental auto-vacuum, so purges can release pages without a full VACUUM."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.execute(text("PRAGMA auto_vacuum")).scalar() == SQLITE_AUTO_VACUUM_INCREMENTAL:
+            return
+        logger.info("Enabling incremental auto-vacuum...")
+        conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        # The mode only changes with a VACUUM, once
+        conn.execute(text("VACUUM"))
+
+def _migrate_seen_ads():
+    """Move seen ads from the old (chat_id, url, ad_link) TEXT table to the hashed schema."""
+    columns = {c["name"] for c in inspect(engine).get_columns("seen_ads")} if inspect(engine).has_table("seen_ads") else set()
+    if "ad_link" not in columns:
+        return
+
+    logger.info("Migrating seen_ads to the compact hashed schema...")
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE seen_ads RENAME TO seen_ads_legacy"))
+        # Indexes keep their names after a rename, drop them so the new table can be created
+        for index in inspect(conn).get_indexes("seen_ads_legacy"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+        SeenAd.__table__.create(conn)
+
+        rows = conn.execute(text(
+            "SELECT w.id, s.ad_link FROM seen_ads_legacy s "
+            "JOIN watchlist w ON w.chat_id = s.chat_id AND w.url = s.url"
+        )).all()
+        now = int(time.time())
+        migrated = {(watchlist_id, ad_hash(ad_link)) for watchlist_id, ad_link in rows}
+        if migrated:
+            conn.execute(
+                SeenAd.__table__.insert(),
+                [{"watchlist_id": w, "item_hash": h, "seen_at": now} for w, h in migrated],
+            )
+        conn.execute(text("DROP TABLE seen_ads_legacy"))
+    logger.info(f"Migrated {len(migrated)} seen ads")
+
+    if engine.dialect.name == "sqlite":
+        # Reclaim the space used by the old table
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+
+async def purge_seen_ads(session: AsyncSession, retention_days: int) -> int:
+    """Delete seen ads older than `retention_days`; a write intent for the database writer."""
+    cutoff = int(time.time()) - retention_days * 86400
+    result = await session.execute(delete(SeenAd).where(SeenAd.seen_at < cutoff))
+    return result.rowcount
+
+def compact_database():
+    """Give the pages freed by purged rows back to the filesystem (SQLite only).
+
+    Only releases free pages, unlike a full VACUUM it doesn't rewrite the database.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    connection = engine.raw_connection()
+    try:
+        # A plain execute steps the pragma once and frees a single page, executescript runs it through
+        connection.driver_connection.executescript("PRAGMA incremental_vacuum;")
+    finally:
+        connection.close()
+
+_enable_incremental_vacuum()
+_migrate_seen_ads()
+Base.metadata.create_all(engine)
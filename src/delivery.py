@@ -0,0 +1,185 @@
+import asyncio
+import time
+import logging
+from typing import Dict
+
+from telegram.constants import MessageLimit
+from telegram.error import Forbidden, NetworkError, RetryAfter, TelegramError
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import SessionLocal, Outbox
+from scheduler import TokenBucket
+from writer import db_writer
+from circuit_breaker import backoff_delay
+from metrics import notifications_total, queue_depth, stage_seconds
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, DIGEST_MAX_ADS, DELIVERY_MAX_RETRIES, OUTBOX_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_RETRY_BASE_DELAY = 30  # Delay before retrying a message whose delivery round failed, doubled per round (seconds)
+OUTBOX_RETRY_MAX_DELAY = 900  # Longest delay between delivery rounds of a message (seconds)
+
+def build_digest(messages: list[str]) -> str:
+    """Merge several ad messages into a single Telegram message."""
+    if len(messages) == 1:
+        return messages[0]
+    return f"🆕 {len(messages)} avisos nuevos\n\n" + "\n\n".join(messages)
+
+def load_outbox(exclude: set[int]) -> list[tuple[int, str, str]]:
+    """(id, chat_id, text) of the outbox messages due for delivery, oldest first."""
+    session = SessionLocal()
+    try:
+        rows = (
+            session.query(Outbox.id, Outbox.chat_id, Outbox.text)
+            .filter(Outbox.next_attempt_at <= time.time())
+            .order_by(Outbox.id)
+            .all()
+        )
+        return [row for row in rows if row.id not in exclude]
+    finally:
+        session.close()
+
+async def delete_outbox(session: AsyncSession, ids: list[int]):
+    await session.execute(delete(Outbox).where(Outbox.id.in_(ids)))
+
+async def postpone_outbox(session: AsyncSession, ids: list[int]):
+    """Count a failed delivery round and push the messages' next attempt back."""
+    for message in await session.scalars(select(Outbox).where(Outbox.id.in_(ids))):
+        message.attempts += 1
+        message.next_attempt_at = time.time() + backoff_delay(message.attempts, OUTBOX_RETRY_BASE_DELAY, OUTBOX_RETRY_MAX_DELAY)
+
+class DeliveryQueue:
+    """Telegram delivery worker draining the outbox table, independently of scraping.
+
+    The monitor writes new-ad messages to the outbox in the same transaction
+    that marks the ads as seen, then calls `notify`. Each chat with due
+    messages gets its own sender task, paced by a per-chat token bucket and a
+    global one shared by every chat. Messages that pile up for a chat are
+    merged into digests of up to `digest_size` ads. A RetryAfter from Telegram
+    pauses all sending for the requested time before the message is retried.
+
+    A message leaves the outbox only once Telegram accepted it (or rejected it
+    for good), so undelivered messages survive crashes and restarts and are
+    retried later without re-scraping.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, digest_size: int, max_retries: int):
+        self.chat_rate = chat_rate
+        self.digest_size = max(1, digest_size)
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._pending: Dict[str, list[tuple[int, str]]] = {}
+        self._queued: set[int] = set()
+        self._senders: Dict[str, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    def notify(self):
+        """Tell the worker that new messages were committed to the outbox."""
+        self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._queued)
+
+    def _next_batch(self, chat_id: str) -> list[tuple[int, str]]:
+        """Take as many pending messages as fit in one digest."""
+        messages = self._pending[chat_id]
+        batch = [messages.pop(0)]
+        while messages and len(batch) < self.digest_size:
+            texts = [text for _, text in batch + messages[:1]]
+            if len(build_digest(texts)) > MessageLimit.MAX_TEXT_LENGTH:
+                break
+            batch.append(messages.pop(0))
+        if not messages:
+            del self._pending[chat_id]
+        return batch
+
+    async def _send(self, bot, chat_id: str, text: str) -> str:
+        """Send one message, retrying flood limits and network errors.
+
+        Returns "sent", "rejected" (it will never go through) or "failed".
+        """
+        for attempt in range(self.max_retries + 1):
+            pause = self._paused_until - time.time()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.global_bucket.acquire()
+            try:
+                with stage_seconds.time(stage="send"):
+                    await bot.send_message(chat_id=int(chat_id), text=text)
+                return "sent"
+            except RetryAfter as e:
+                logger.warning(f"Telegram flood limit hit sending to {chat_id}, pausing delivery for {e.retry_after} seconds")
+                self._paused_until = max(self._paused_until, time.time() + e.retry_after)
+            except Forbidden as e:
+                logger.warning(f"Chat {chat_id} can't be messaged anymore: {e}")
+                return "rejected"
+            except NetworkError as e:
+                delay = backoff_delay(attempt)
+                logger.warning(f"Failed to send message to {chat_id}: {e}. Retrying in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+            except TelegramError as e:
+                logger.error(f"Failed to send message to {chat_id}: {e}")
+                return "rejected"
+        logger.error(f"Failed to send message to {chat_id} after {self.max_retries + 1} attempts, will retry later")
+        return "failed"
+
+    async def _drain(self, bot, chat_id: str):
+        ids = []
+        try:
+            bucket = self._chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, 1))
+            while self._pending.get(chat_id):
+                await bucket.acquire()
+                batch = self._next_batch(chat_id)
+                ids = [message_id for message_id, _ in batch]
+                result = await self._send(bot, chat_id, build_digest([text for _, text in batch]))
+                if result == "failed":
+                    self.failed += len(batch)
+                    await db_writer.write(lambda session: postpone_outbox(session, ids))
+                else:
+                    if result == "sent":
+                        self.sent += len(batch)
+                    else:
+                        self.failed += len(batch)
+                    await db_writer.write(lambda session: delete_outbox(session, ids))
+                self._queued.difference_update(ids)
+        except Exception as e:
+            logger.error(f"[ERROR] Delivery to {chat_id} failed: {e}")
+            # Leave the batch and whatever is left in the outbox to the next poll
+            self._queued.difference_update(ids)
+            for message_id, _ in self._pending.pop(chat_id, []):
+                self._queued.discard(message_id)
+        finally:
+            del self._senders[chat_id]
+
+    async def _load(self):
+        for message_id, chat_id, text in await asyncio.to_thread(load_outbox, set(self._queued)):
+            self._queued.add(message_id)
+            self._pending.setdefault(chat_id, []).append((message_id, text))
+
+    async def run(self, bot):
+        """Drain the outbox forever: on every notify, and every OUTBOX_POLL_INTERVAL for retries."""
+        while True:
+            try:
+                await self._load()
+                for chat_id in list(self._pending):
+                    if chat_id not in self._senders:
+                        self._senders[chat_id] = asyncio.create_task(self._drain(bot, chat_id))
+            except Exception as e:
+                logger.error(f"[ERROR] Failed to load the outbox: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+# Global delivery worker, notified by the monitor after it commits new messages
+delivery_queue = DeliveryQueue(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, DIGEST_MAX_ADS, DELIVERY_MAX_RETRIES)
+queue_depth.track(delivery_queue.pending, queue="delivery")
+notifications_total.track(lambda: delivery_queue.sent, result="sent")
+notifications_total.track(lambda: delivery_queue.failed, result="failed")
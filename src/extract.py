@@ -0,0 +1,202 @@
+import re
+import json
+import hashlib
+import logging
+from typing import Optional
+
+import lxml.html
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Targeted extraction with lxml/XPath. Each function parses the page once with
+# lxml's C parser and only visits the nodes it needs, instead of building a
+# BeautifulSoup tree and walking the whole page text.
+
+PUBLISHED_TODAY = "Publicados hoy"
+
+ITEM_ID_REGEX = re.compile(r"\b(ML[A-Z])-?(\d+)")
+CARD_YEAR_REGEX = re.compile(r"^\d{4}$")
+CARD_KM_REGEX = re.compile(r"^([\d.,]+)\s*km$", re.IGNORECASE)
+YEAR_KM_REGEX = re.compile(r"(\d{4})\s*\|\s*([\d.,]+)\s*km\s*·\s*Publicado")
+LOCATION_JSON_REGEX = re.compile(r'"city":"([^"]+)","neighborhood":"([^"]+)","state":"([^"]+)"')
+
+_PUBLISHED_TODAY_XPATH = etree.XPath("boolean(//text()[. = $label])")
+_LISTING_HREFS_XPATH = etree.XPath("//a[contains(concat(' ', normalize-space(@class), ' '), ' poly-component__title ')]/@href")
+_NEXT_PAGE_XPATH = etree.XPath("(//li[contains(concat(' ', normalize-space(@class), ' '), ' andes-pagination__button--next ')]/a/@href)[1]")
+_RESULT_COUNT_XPATH = etree.XPath("(//*[contains(concat(' ', normalize-space(@class), ' '), ' ui-search-search-result__quantity-results ')])[1]")
+_CARDS_XPATH = etree.XPath("//*[contains(concat(' ', normalize-space(@class), ' '), ' poly-card ')]")
+_CARD_LINK_XPATH = etree.XPath(".//a[contains(concat(' ', normalize-space(@class), ' '), ' poly-component__title ')]")
+_CARD_PRICE_XPATH = etree.XPath("(.//*[contains(concat(' ', normalize-space(@class), ' '), ' poly-price__current ')]//*[contains(concat(' ', normalize-space(@class), ' '), ' andes-money-amount__fraction ')])[1]")
+_CARD_CURRENCY_XPATH = etree.XPath("(.//*[contains(concat(' ', normalize-space(@class), ' '), ' poly-price__current ')]//*[contains(concat(' ', normalize-space(@class), ' '), ' andes-money-amount__currency-symbol ')])[1]")
+_CARD_ATTRIBUTES_XPATH = etree.XPath(".//*[contains(concat(' ', normalize-space(@class), ' '), ' poly-attributes_list__item ')]")
+_CARD_LOCATION_XPATH = etree.XPath("(.//*[contains(concat(' ', normalize-space(@class), ' '), ' poly-component__location ')])[1]")
+_TITLE_XPATH = etree.XPath("(//title)[1]")
+_PRICE_XPATH = etree.XPath("(//*[contains(concat(' ', normalize-space(@class), ' '), ' andes-money-amount__fraction ')])[1]")
+_CURRENCY_XPATH = etree.XPath("(//*[contains(concat(' ', normalize-space(@class), ' '), ' andes-money-amount__currency-symbol ')])[1]")
+_VISIBLE_TEXT_XPATH = etree.XPath("//text()[not(ancestor::script) and not(ancestor::style)]")
+
+def parse_document(html: str):
+    """Parse an HTML page with lxml, or return None if it's empty or unparseable."""
+    if not html or not html.strip():
+        return None
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        return lxml.html.document_fromstring(html.encode("utf-8"))
+    except etree.ParserError as e:
+        logger.warning(f"Failed to parse HTML: {e}")
+        return None
+
+def _clean_title(doc) -> str:
+    nodes = _TITLE_XPATH(doc)
+    if not nodes:
+        return ""
+    return nodes[0].text_content().strip().replace(" | MercadoLibre", "")
+
+def _result_count(doc) -> Optional[int]:
+    nodes = _RESULT_COUNT_XPATH(doc)
+    digits = re.sub(r"\D", "", nodes[0].text_content()) if nodes else ""
+    return int(digits) if digits else None
+
+def _first_text(nodes) -> Optional[str]:
+    text = nodes[0].text_content().strip() if nodes else ""
+    return text or None
+
+def _parse_card(card) -> Optional[dict]:
+    """Car fields shown on a search result card, None for those that are missing."""
+    links = _CARD_LINK_XPATH(card)
+    if not links or not links[0].get("href"):
+        return None
+
+    price = _first_text(_CARD_PRICE_XPATH(card))
+    currency = _first_text(_CARD_CURRENCY_XPATH(card))
+    if price and currency:
+        price = f"{currency} {price}"
+
+    year = kilometers = None
+    for attribute in _CARD_ATTRIBUTES_XPATH(card):
+        text = attribute.text_content().strip()
+        if CARD_YEAR_REGEX.match(text):
+            year = text
+        elif match := CARD_KM_REGEX.match(text):
+            kilometers = match.group(1)
+
+    # Cards show "City - State", notifications use "City, State"
+    location = _first_text(_CARD_LOCATION_XPATH(card))
+    if location:
+        location = location.replace(" - ", ", ")
+
+    return {
+        "title": links[0].text_content().strip() or None,
+        "price": price,
+        "year": year,
+        "kilometers": kilometers,
+        "location": location,
+        "url": links[0].get("href").split("#")[0],
+    }
+
+def parse_search_page(html: str, url: str) -> dict:
+    """Extract everything used from a search results page in a single parse.
+
+    Returns the page title, the ad links, each ad's card fields (see
+    _parse_card) keyed by link, the next page's URL (`_Desde_N`) and the total
+    result count. Ads are only returned when the "Publicados hoy" filter is
+    applied.
+    """
+    page = {"title": url, "ads": [], "cards": {}, "next_url": None, "result_count": None}
+    doc = parse_document(html)
+    if doc is None:
+        return page
+    page["title"] = _clean_title(doc) or url
+    page["result_count"] = _result_count(doc)
+    # Cheap substring test first: most pages without the filter label are never searched
+    if PUBLISHED_TODAY in html and _PUBLISHED_TODAY_XPATH(doc, label=PUBLISHED_TODAY):
+        page["ads"] = [href.split("#")[0] for href in _LISTING_HREFS_XPATH(doc) if href]
+        for card in _CARDS_XPATH(doc):
+            fields = _parse_card(card)
+            if fields:
+                page["cards"][fields["url"]] = fields
+        next_urls = _NEXT_PAGE_XPATH(doc)
+        page["next_url"] = str(next_urls[0]) if next_urls else None
+    return page
+
+def parse_listings(html: str) -> list[str]:
+    """Extract the ad links from a search results page."""
+    # Cheap substring test first: most pages without the filter label can be skipped unparsed
+    if PUBLISHED_TODAY not in html:
+        return []
+    doc = parse_document(html)
+    if doc is None or not _PUBLISHED_TODAY_XPATH(doc, label=PUBLISHED_TODAY):
+        return []
+    return [href.split("#")[0] for href in _LISTING_HREFS_XPATH(doc) if href]
+
+def results_fingerprint(html: str) -> str:
+    """Hash of the page's result set, computed from the raw HTML without parsing it.
+
+    It covers the item IDs in page order and whether the "Publicados hoy" label
+    is present, and ignores per-request noise such as tracking IDs in links.
+    """
+    item_ids = ",".join(prefix + digits for prefix, digits in ITEM_ID_REGEX.findall(html))
+    published_today = PUBLISHED_TODAY in html
+    return hashlib.blake2b(f"{published_today}|{item_ids}".encode(), digest_size=16).hexdigest()
+
+def parse_title(html: str, url: str) -> str:
+    """Extract the page title, falling back to the URL itself."""
+    doc = parse_document(html)
+    if doc is None:
+        return url
+    title = _clean_title(doc)
+    return title if title else url
+
+def _unescape_json_string(value: str) -> str:
+    try:
+        return json.loads(f'"{value}"')
+    except ValueError:
+        return value
+
+def parse_car_details(html: str, url: str) -> dict:
+    """Extract the car fields shown in notifications from a listing page."""
+    doc = parse_document(html)
+
+    title = "Sin título"
+    price = "Precio no disponible"
+    year = "Año no disponible"
+    kilometers = "KM no disponible"
+    location = "Ubicación no disponible"
+
+    if doc is not None:
+        title = _clean_title(doc) or title
+
+        price_nodes = _PRICE_XPATH(doc)
+        if price_nodes:
+            price = price_nodes[0].text_content().strip()
+            currency_nodes = _CURRENCY_XPATH(doc)
+            if currency_nodes:
+                price = f"{currency_nodes[0].text_content().strip()} {price}"
+
+    # "2015 | 120.000 km · Publicado hace ..." usually sits in a single text node,
+    # only fall back to joining the visible text when the raw page doesn't match
+    match = YEAR_KM_REGEX.search(html)
+    if not match and doc is not None:
+        match = YEAR_KM_REGEX.search("".join(_VISIBLE_TEXT_XPATH(doc)))
+    if match:
+        year = match.group(1)
+        kilometers = match.group(2)
+
+    # The location lives in the page's embedded JSON state
+    match = LOCATION_JSON_REGEX.search(html)
+    if match:
+        city = _unescape_json_string(match.group(1))
+        state = _unescape_json_string(match.group(3))
+        location = f"{city}, {state}"
+
+    return {
+        "title": title,
+        "price": price,
+        "year": year,
+        "kilometers": kilometers,
+        "location": location,
+        "url": url
+    }
@@ -1,13 +1,59 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from database import SessionLocal, Watchlist, SeenAd, BotState
-from scraper import MELI_REGEX, ensure_published_today_filter, get_title_from_url, transform_listado_to_autos
+from database import Watchlist, SeenAd, BotState, SearchState, SearchGeneration
+from scheduler import due_queue
+from config import BOT_ROLE
+from writer import db_writer
+from registry import registry
+from scraper import MELI_REGEX, ensure_published_today_filter, transform_listado_to_autos
+from tasks import resolve_titles
 
 logger = logging.getLogger(__name__)
 
+async def invalidate_search_states(session: AsyncSession, urls) -> dict[str, int]:
+    """Forget the stored fingerprints of these searches so their next check is processed in full.
+
+    Needed whenever a chat should be notified about ads on a page that may not
+    have changed since it was last checked (new subscription, cleared seen ads,
+    resumed monitoring). Also bumps the searches' generations, so checks that
+    started before (in any process) don't write their state back; returns the
+    new generations for the registry.
+    """
+    urls = set(urls)
+    await session.execute(delete(SearchState).where(SearchState.url.in_(urls)))
+    await session.execute(
+        update(SearchGeneration).where(SearchGeneration.url.in_(urls)).values(generation=SearchGeneration.generation + 1)
+    )
+    generations = dict((await session.execute(
+        select(SearchGeneration.url, SearchGeneration.generation).where(SearchGeneration.url.in_(urls))
+    )).all())
+    for url in urls - generations.keys():
+        session.add(SearchGeneration(url=url, generation=1))
+        generations[url] = 1
+    return generations
+
+async def set_bot_state(session: AsyncSession, chat_id: str, is_running: bool):
+    """Get or create the chat's bot state and set whether it is monitoring."""
+    bot_state = await session.scalar(select(BotState).filter_by(chat_id=chat_id))
+    if not bot_state:
+        session.add(BotState(chat_id=chat_id, is_running=is_running))
+    else:
+        bot_state.is_running = is_running
+
+async def delete_watchlist_entry(session: AsyncSession, entry_id: int):
+    """Delete a watchlist entry and the ads its chat has seen for it."""
+    await session.execute(delete(SeenAd).filter_by(watchlist_id=entry_id))
+    await session.execute(delete(Watchlist).filter_by(id=entry_id))
+
+def watchlist_keyboard(entries: list[Watchlist]) -> InlineKeyboardMarkup:
+    # Use cached titles from the registry
+    keyboard = [[InlineKeyboardButton(u.title or u.url, callback_data=f"remove::{u.id}")] for u in entries]
+    return InlineKeyboardMarkup(keyboard)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("👋 Hola! Mandame un link de MercadoLibre para seguirlo. Usa /help para más comandos.")
 
@@ -38,12 +84,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ No se encontraron URLs válidas en el mensaje.")
         return
     
-    session: Session = SessionLocal()
     results = []
+    new_entries = {}
+    untitled_urls = []
     
     # Check if this is the user's first URL (to set bot state to running)
-    existing_urls = session.query(Watchlist).filter_by(chat_id=chat_id).count()
-    is_first_url = existing_urls == 0
+    is_first_url = not registry.entries_for_chat(chat_id)
     
     for original_url in urls:
         if not MELI_REGEX.match(original_url):
@@ -53,29 +99,44 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Transform the URL for processing and storage
         transformed_url = ensure_published_today_filter(original_url)
         
-        exists = session.query(Watchlist).filter_by(chat_id=chat_id, url=transformed_url).first()
-        if exists:
+        if registry.find(chat_id, transformed_url) or transformed_url in new_entries:
             results.append(f"✅ {original_url} - Ya estabas siguiendo ese link")
         else:
-            # Extract title for the URL
-            title = get_title_from_url(transformed_url)
+            # Reuse the title if someone else already follows this search,
+            # otherwise it's fetched in the background after replying
+            title = registry.title_for(transformed_url)
+            if title is None:
+                untitled_urls.append(transformed_url)
             
-            # Add to watchlist with title
-            watchlist_entry = Watchlist(chat_id=chat_id, url=transformed_url, title=title)
-            session.add(watchlist_entry)
+            new_entries[transformed_url] = title
             results.append(f"🔔 {original_url} - ¡Empezaré a monitorear ese link!")
+    added_urls = list(new_entries)
     
-    # If this is the user's first URL, set bot state to running
-    if is_first_url:
-        bot_state = session.query(BotState).filter_by(chat_id=chat_id).first()
-        if not bot_state:
-            bot_state = BotState(chat_id=chat_id, is_running=True)
-            session.add(bot_state)
-        else:
-            bot_state.is_running = True
+    async def add_entries(session: AsyncSession) -> tuple[list[Watchlist], dict[str, int]]:
+        # Add to watchlist with title
+        entries = [Watchlist(chat_id=chat_id, url=url, title=title) for url, title in new_entries.items()]
+        session.add_all(entries)
+        # If this is the user's first URL, set bot state to running
+        if is_first_url:
+            await set_bot_state(session, chat_id, True)
+        generations = await invalidate_search_states(session, added_urls) if added_urls else {}
+        return entries, generations
     
-    session.commit()
-    session.close()
+    if new_entries or is_first_url:
+        entries, generations = await db_writer.write(add_entries)
+        for entry in entries:
+            registry.add(entry)
+        registry.set_state_generations(generations)
+        if is_first_url:
+            registry.set_running(chat_id, True)
+    
+    # Check the new searches right away instead of waiting for their turn
+    # (in the "frontend" role the workers pick them up on their next sync)
+    if BOT_ROLE == "all":
+        for url in added_urls:
+            due_queue.schedule_now(url)
+    if untitled_urls:
+        context.application.create_task(resolve_titles(untitled_urls))
     
     # Send results as a single message
     response_text = "\n".join(results)
@@ -90,41 +151,37 @@ async def remove_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Transform the URL to match what's stored in the database
     transformed_url = ensure_published_today_filter(original_url)
     
-    session: Session = SessionLocal()
-    entry = session.query(Watchlist).filter_by(chat_id=chat_id, url=transformed_url).first()
+    entry = registry.find(chat_id, transformed_url)
     if entry:
         # Delete all seen ads for this user and this url
-        session.query(SeenAd).filter_by(chat_id=chat_id, url=entry.url).delete()
-        session.delete(entry)
-        session.commit()
+        await db_writer.write(lambda session: delete_watchlist_entry(session, entry.id))
+        registry.remove(entry.id)
         await update.message.reply_text("✅ Link eliminado de tu lista.")
     else:
         await update.message.reply_text("⚠️ No estabas siguiendo ese link.")
-    session.close()
 
 async def clear_seen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = str(update.message.chat_id)
-    session: Session = SessionLocal()
-    # Delete all seen ads for this user
-    session.query(SeenAd).filter_by(chat_id=chat_id).delete()
-    session.commit()
-    session.close()
+    urls = [entry.url for entry in registry.entries_for_chat(chat_id)]
+    async def clear(session: AsyncSession) -> dict[str, int]:
+        # Delete all seen ads for this user
+        watchlist_ids = select(Watchlist.id).filter_by(chat_id=chat_id)
+        await session.execute(delete(SeenAd).where(SeenAd.watchlist_id.in_(watchlist_ids.scalar_subquery())))
+        return await invalidate_search_states(session, urls)
+    
+    registry.set_state_generations(await db_writer.write(clear))
     await update.message.reply_text("🧹 Se borraron todos los avisos vistos.")
 
 async def list_urls(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = str(update.message.chat_id)
-    session: Session = SessionLocal()
-    urls = session.query(Watchlist).filter_by(chat_id=chat_id).all()
-    session.close()
+    urls = registry.entries_for_chat(chat_id)
     if not urls:
         await update.message.reply_text("📭 No estás siguiendo ningún link.")
         return
     
-    # Use cached titles from database
-    keyboard = [[InlineKeyboardButton(u.title or u.url, callback_data=f"remove::{u.id}")] for u in urls]
     await update.message.reply_text(
         "📋 Tus links actuales (toca uno para eliminar):",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=watchlist_keyboard(urls),
     )
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -132,20 +189,16 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     if query.data.startswith("remove::"):
         id = int(query.data.split("::")[1])
-        session: Session = SessionLocal()
-        entry = session.query(Watchlist).filter_by(id=id).first()
         chat_id = str(query.message.chat_id)
-        if entry:
-            session.delete(entry)
-            session.commit()
-        urls = session.query(Watchlist).filter_by(chat_id=chat_id).all()
-        session.close()
+        entry = registry.get(id)
+        if entry and entry.chat_id == chat_id:
+            await db_writer.write(lambda session: delete_watchlist_entry(session, id))
+            registry.remove(id)
+        urls = registry.entries_for_chat(chat_id)
         if urls:
-            # Use cached titles from database
-            keyboard = [[InlineKeyboardButton(u.title or u.url, callback_data=f"remove::{u.id}")] for u in urls]
             await query.edit_message_text(
                 text="📋 Tus links actuales (toca uno para eliminar):",
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                reply_markup=watchlist_keyboard(urls),
             )
         else:
             await query.edit_message_text("📭 No estás siguiendo ningún link.")
@@ -161,45 +214,29 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
 async def stop_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Stop the bot monitoring for this user."""
     chat_id = str(update.message.chat_id)
-    session: Session = SessionLocal()
-    
     try:
-        # Get or create bot state for this user
-        bot_state = session.query(BotState).filter_by(chat_id=chat_id).first()
-        if not bot_state:
-            bot_state = BotState(chat_id=chat_id, is_running=False)
-            session.add(bot_state)
-        else:
-            bot_state.is_running = False
-        
-        session.commit()
+        await db_writer.write(lambda session: set_bot_state(session, chat_id, False))
+        registry.set_running(chat_id, False)
         await update.message.reply_text("⏸️ Bot pausado. No recibirás más notificaciones hasta que uses /resume.")
         
     except Exception as e:
         logger.error(f"Error stopping bot for {chat_id}: {e}")
         await update.message.reply_text("❌ Error al pausar el bot.")
-    finally:
-        session.close()
 
 async def resume_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Resume the bot monitoring for this user."""
     chat_id = str(update.message.chat_id)
-    session: Session = SessionLocal()
+    urls = [entry.url for entry in registry.entries_for_chat(chat_id)]
+    async def resume(session: AsyncSession) -> dict[str, int]:
+        await set_bot_state(session, chat_id, True)
+        # Ads published while paused may sit on pages that haven't changed since
+        return await invalidate_search_states(session, urls)
     
     try:
-        # Get or create bot state for this user
-        bot_state = session.query(BotState).filter_by(chat_id=chat_id).first()
-        if not bot_state:
-            bot_state = BotState(chat_id=chat_id, is_running=True)
-            session.add(bot_state)
-        else:
-            bot_state.is_running = True
-        
-        session.commit()
+        registry.set_state_generations(await db_writer.write(resume))
+        registry.set_running(chat_id, True)
         await update.message.reply_text("▶️ Bot reanudado. Volverás a recibir notificaciones de nuevos avisos.")
         
     except Exception as e:
         logger.error(f"Error resuming bot for {chat_id}: {e}")
-        await update.message.reply_text("❌ Error al reanudar el bot.")
-    finally:
-        session.close()
\ No newline at end of file
+        await update.message.reply_text("❌ Error al reanudar el bot.")
\ No newline at end of file
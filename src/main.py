@@ -1,4 +1,5 @@
 import asyncio
+import multiprocessing
 import nest_asyncio
 import logging
 import logging.handlers
@@ -12,7 +13,7 @@ from telegram.ext import (
     filters,
 )
 
-from config import TELEGRAM_TOKEN, CHECK_INTERVAL
+from config import TELEGRAM_TOKEN, CHECK_INTERVAL, SEEN_AD_PURGE_INTERVAL, PROXY_HEALTH_CHECK_INTERVAL, BOT_ROLE, WORKER_PROCESSES, METRICS_HOST, METRICS_PORT
 from handlers import (
     start,
     help_command,
@@ -26,7 +27,14 @@ from handlers import (
     unknown_command,
     error_handler,
 )
-from tasks import check_for_new_ads
+from tasks import check_for_new_ads, purge_old_seen_ads
+from proxy_manager import proxy_manager
+from delivery import delivery_queue
+from sharding import ShardLeases
+from database import engine, async_engine
+from writer import db_writer
+from registry import registry
+import metrics
 
 log_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
 file_handler = logging.handlers.TimedRotatingFileHandler("bot.log", when="midnight", interval=1, backupCount=2)
@@ -41,6 +49,11 @@ if logger.hasHandlers():
 
 logger.addHandler(console_handler)
 
+async def start_monitor(leases: ShardLeases = None):
+    # Without the first proxy health check the first round would find no proxies
+    await proxy_manager.checked.wait()
+    await check_for_new_ads(CHECK_INTERVAL, leases)
+
 async def start_bot():
     app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
 
@@ -59,15 +72,89 @@ async def start_bot():
 
     app.add_error_handler(error_handler)
 
-    asyncio.create_task(check_for_new_ads(app, CHECK_INTERVAL))
+    db_writer.start()
+    await registry.load()
+    metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    # The front-end fetches search titles too, so it needs scored proxies in every role
+    asyncio.create_task(proxy_manager.run_health_checks(PROXY_HEALTH_CHECK_INTERVAL))
+    # In the "frontend" role the monitoring runs in separate worker processes
+    if BOT_ROLE == "all":
+        asyncio.create_task(start_monitor())
+    asyncio.create_task(delivery_queue.run(app.bot))
+    asyncio.create_task(purge_old_seen_ads(SEEN_AD_PURGE_INTERVAL))
 
-    logger.info("Bot running...")
-    await app.run_polling(close_loop=False, stop_signals=[SIGINT, SIGTERM])
+    logger.info(f"Bot running ({BOT_ROLE})...")
+    try:
+        await app.run_polling(close_loop=False, stop_signals=[SIGINT, SIGTERM])
+    finally:
+        if metrics_server:
+            metrics_server.close()
+        await db_writer.close()
+        # Pooled async connections (aiosqlite threads) would keep the process alive
+        await async_engine.dispose()
 
-if __name__ == "__main__":
+async def start_worker(index: int = 0):
+    """Monitoring worker: checks the searches of the shards it leases, without Telegram polling."""
+    leases = ShardLeases()
+    db_writer.start()
+    metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT + 1 + index) if METRICS_PORT else None
+    asyncio.create_task(proxy_manager.run_health_checks(PROXY_HEALTH_CHECK_INTERVAL))
+    monitor = asyncio.create_task(start_monitor(leases))
+
+    loop = asyncio.get_running_loop()
+    for sig in (SIGINT, SIGTERM):
+        loop.add_signal_handler(sig, monitor.cancel)
+
+    logger.info(f"Worker {leases.worker_id} running...")
+    try:
+        await monitor
+    except asyncio.CancelledError:
+        pass
+    finally:
+        # Hand our shards over right away instead of letting them expire
+        await asyncio.to_thread(leases.release)
+        if metrics_server:
+            metrics_server.close()
+        await proxy_manager.aclose()
+        await db_writer.close()
+        await async_engine.dispose()
+        logger.info(f"Worker {leases.worker_id} stopped")
+
+def run_worker(index: int = 0):
+    # A forked worker inherits the parent's pooled connections (the import-time
+    # migration leaves one behind): drop them without closing the parent's handles
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    asyncio.run(start_worker(index))
+
+def run_workers(processes: int):
+    """Run `processes` monitoring workers, each in its own process (and core)."""
+    if processes <= 1:
+        run_worker()
+        return
+    workers = [multiprocessing.Process(target=run_worker, args=(i,), name=f"worker-{i}") for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Ctrl+C reaches the whole process group, wait for the workers to release their shards
+        for worker in workers:
+            worker.join()
+
+def main():
+    if BOT_ROLE not in ("all", "frontend", "worker"):
+        raise SystemExit(f"Unknown BOT_ROLE {BOT_ROLE!r}, use all, frontend or worker")
+    if BOT_ROLE == "worker":
+        run_workers(WORKER_PROCESSES)
+        return
     try:
         nest_asyncio.apply()
         loop = asyncio.get_event_loop()
         loop.run_until_complete(start_bot())
     except (KeyboardInterrupt, SystemExit):
-        print("🛑 Bot stopped manually.")
\ No newline at end of file
+        print("🛑 Bot stopped manually.")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
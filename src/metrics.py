@@ -0,0 +1,191 @@
+import asyncio
+import bisect
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Minimal Prometheus text-format metrics, served over HTTP from the bot
+# process. Metrics are updated from the event loop and from worker threads,
+# so every series update takes the metric's lock.
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600)
+CYCLE_BUCKETS = (30, 60, 120, 300, 600, 900, 1800, 3600, 7200)
+
+_metrics: list["Metric"] = []
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A named metric with optional labels; one series per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series: Dict[tuple, object] = {}
+        self._tracked: Dict[tuple, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def track(self, function: Callable[[], float], **labels):
+        """Read this series from `function` whenever the metrics are collected."""
+        self._tracked[self._key(labels)] = function
+
+    def retain(self, label: str, values):
+        """Drop the series whose `label` is not in `values` (e.g. searches nobody follows anymore)."""
+        index = self.labels.index(label)
+        values = set(values)
+        with self._lock:
+            for key in [key for key in self._series if key[index] not in values]:
+                del self._series[key]
+
+    def _samples(self):
+        """(name suffix, label values, extra label, value) of every sample."""
+        with self._lock:
+            series = dict(self._series)
+        for key, value in series.items():
+            yield "", key, "", value
+        for key, function in self._tracked.items():
+            try:
+                yield "", key, "", function()
+            except Exception as e:
+                logger.debug(f"Failed to collect {self.name}: {e}")
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes, in seconds."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def _samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield "_bucket", key, f'le="{_format_value(float(bound))}"', cumulative
+            yield "_sum", key, "", total
+            yield "_count", key, "", count
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await reader.readline()
+        # Skip the headers, nothing in them matters here
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.split()
+        if len(parts) > 1 and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found, try /metrics\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+async def serve(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    """Serve /metrics on host:port; returns the server, or None if the port is taken."""
+    try:
+        server = await asyncio.start_server(_handle, host, port)
+    except OSError as e:
+        logger.error(f"[ERROR] Can't serve metrics on {host}:{port}: {e}")
+        return None
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+# Hot path stages and scraping
+stage_seconds = Histogram("melipal_stage_seconds", "Time spent in each hot path stage (fetch, parse, db, send)", ("stage",))
+requests_total = Counter("melipal_requests_total", "MercadoLibre requests by proxy and outcome", ("proxy", "outcome"))
+
+# Monitoring cycle
+check_seconds = Histogram("melipal_check_seconds", "Time to check one search, pagination included", buckets=LATENCY_BUCKETS + (60, 120))
+cycle_seconds = Histogram("melipal_cycle_seconds", "Time between two checks of the same search", buckets=CYCLE_BUCKETS)
+check_interval_seconds = Gauge("melipal_check_interval_seconds", "Configured CHECK_INTERVAL")
+schedule_lag_seconds = Histogram("melipal_schedule_lag_seconds", "How long due searches waited for a free worker", buckets=LAG_BUCKETS)
+new_ads_total = Counter("melipal_new_ads_total", "New ads found per search", ("search",))
+
+# Queues, caches, database and delivery
+queue_depth = Gauge("melipal_queue_depth", "Items waiting in each queue", ("queue",))
+cache_requests_total = Counter("melipal_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+db_write_seconds = Histogram("melipal_db_write_seconds", "Time from queueing a database write to its commit")
+db_writes_total = Counter("melipal_db_writes_total", "Database writes by result", ("result",))
+notifications_total = Counter("melipal_notifications_total", "Notified ads by delivery result", ("result",))
@@ -0,0 +1,113 @@
+import json
+import time
+import logging
+
+from database import SearchSchedule
+from config import CHECK_INTERVAL, MIN_CHECK_INTERVAL, MAX_CHECK_INTERVAL, TARGET_NEW_ADS_PER_CHECK
+
+logger = logging.getLogger(__name__)
+
+# Adaptive polling: each search learns how many new ads per hour it gets,
+# overall and for each hour of the day, and is checked often enough to catch
+# about TARGET_NEW_ADS_PER_CHECK new ads per check. Quiet searches drift
+# towards MAX_CHECK_INTERVAL and busy ones towards MIN_CHECK_INTERVAL.
+#
+# The learned intervals are then stretched by a common budget scale so that
+# all followed searches together make no more requests than checking each
+# one every CHECK_INTERVAL would: busy searches borrow their checks from
+# quiet ones instead of adding to the total.
+
+RATE_SMOOTHING = 0.3  # Weight of the latest observation in the overall rate
+HOURLY_SMOOTHING = 0.2  # Weight of the latest observation in its hour-of-day bucket
+QUIET_STRETCH = 1.5  # Interval growth factor when no new ads are expected
+HOUR_FACTOR_RANGE = (0.25, 4.0)  # How much the time of day may scale the overall rate
+BUDGET_SEARCH_STEPS = 30  # Bisection steps when fitting the budget scale
+START_INTERVAL = float(min(max(CHECK_INTERVAL, MIN_CHECK_INTERVAL), MAX_CHECK_INTERVAL))  # Interval of a search that was never checked
+
+def new_schedule(url: str, now: float = None) -> SearchSchedule:
+    """Schedule for a search that has never been checked: due right away at the default interval."""
+    now = time.time() if now is None else now
+    return SearchSchedule(
+        url=url,
+        interval=START_INTERVAL,
+        rate=0.0,
+        hourly=json.dumps([0.0] * 24),
+        last_checked_at=None,
+        next_due_at=now,
+    )
+
+def _hour_factor(hourly: list[float], hour: int) -> float:
+    mean = sum(hourly) / len(hourly)
+    if mean <= 0:
+        return 1.0
+    low, high = HOUR_FACTOR_RANGE
+    return min(high, max(low, hourly[hour] / mean))
+
+def _budget_interval(interval: float, scale: float) -> float:
+    return min(interval * scale, MAX_CHECK_INTERVAL)
+
+def budget_scale(intervals: list[float], check_interval: float = CHECK_INTERVAL) -> float:
+    """Factor to stretch the learned `intervals` by so that, together, the searches make at most
+    one request per `check_interval` each, i.e. sum(1 / interval) <= len(intervals) / check_interval.
+    
+    Stretched intervals still stop at MAX_CHECK_INTERVAL, so the budget can't
+    be met if that is shorter than `check_interval`; the searches are then all
+    checked every MAX_CHECK_INTERVAL.
+    """
+    if not intervals:
+        return 1.0
+    budget = len(intervals) / check_interval
+    def rate(scale: float) -> float:
+        return sum(1 / _budget_interval(interval, scale) for interval in intervals)
+    if rate(1.0) <= budget:
+        return 1.0
+    low, high = 1.0, MAX_CHECK_INTERVAL / max(min(intervals), 1.0)
+    for _ in range(BUDGET_SEARCH_STEPS):
+        middle = (low + high) / 2
+        if rate(middle) > budget:
+            low = middle
+        else:
+            high = middle
+    return high
+
+def update_schedule(schedule: SearchSchedule, new_ads: int, now: float = None, scale: float = 1.0):
+    """Feed the result of a check into the search's model and set its next due time.
+    
+    `schedule.interval` keeps the learned interval; the next check is due
+    after it is stretched by the budget `scale` (see budget_scale).
+    """
+    now = time.time() if now is None else now
+    elapsed = now - schedule.last_checked_at if schedule.last_checked_at else schedule.interval
+    elapsed_hours = max(elapsed, 1.0) / 3600
+
+    observed = new_ads / elapsed_hours
+    schedule.rate = RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * (schedule.rate or 0.0)
+
+    hourly = json.loads(schedule.hourly) if schedule.hourly else [0.0] * 24
+    hour = time.gmtime(now).tm_hour
+    hourly[hour] = HOURLY_SMOOTHING * observed + (1 - HOURLY_SMOOTHING) * hourly[hour]
+    schedule.hourly = json.dumps([round(value, 4) for value in hourly])
+
+    # Expected new ads per second for the coming hour of the day
+    expected = schedule.rate * _hour_factor(hourly, time.gmtime(now + schedule.interval).tm_hour) / 3600
+    if expected > 0:
+        interval = TARGET_NEW_ADS_PER_CHECK / expected
+    else:
+        interval = schedule.interval * QUIET_STRETCH
+    schedule.interval = float(min(max(interval, MIN_CHECK_INTERVAL), MAX_CHECK_INTERVAL))
+
+    schedule.last_checked_at = now
+    schedule.next_due_at = now + _budget_interval(schedule.interval, scale)
+    logger.debug(f"{schedule.url}: {new_ads} new ads, {schedule.rate:.2f}/h, next check in {schedule.next_due_at - now:.0f}s")
+
+def skip_learning(schedule: SearchSchedule, now: float = None, scale: float = 1.0):
+    """Reschedule after a check whose new ads don't reflect the search's rate (a first
+    check or a resumed backlog): counts as checked, but leaves the model alone."""
+    now = time.time() if now is None else now
+    schedule.last_checked_at = now
+    schedule.next_due_at = now + _budget_interval(schedule.interval, scale)
+
+def retry_later(schedule: SearchSchedule, now: float = None, scale: float = 1.0):
+    """Reschedule a search whose check failed without touching its model."""
+    now = time.time() if now is None else now
+    schedule.next_due_at = now + _budget_interval(schedule.interval, scale)
@@ -1,37 +1,195 @@
-import requests
+import asyncio
+import httpx
 import random
+import requests
 import time
 import logging
 from typing import List, Dict, Optional
 from urllib.parse import urlparse
 import json
 
-from config import USE_PROXY, PROXY_UPDATE_INTERVAL, PROXY_MAX_RETRIES, PROXY_TIMEOUT, PROXY_FALLBACK
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import breakers, backoff_delay, parse_retry_after
+from metrics import requests_total, stage_seconds
+
+from config import (
+    USE_PROXY,
+    PROXY_UPDATE_INTERVAL,
+    PROXY_MAX_RETRIES,
+    PROXY_TIMEOUT,
+    PROXY_FALLBACK,
+    PROXY_LIST,
+    PROXY_TEST_URL,
+    PROXY_HEALTH_CHECK_INTERVAL,
+    PROXY_HEALTH_CHECK_CONCURRENCY,
+    PROXY_POOL_SIZE,
+    PROXY_CHECK_SAMPLE,
+    HTTP_POOL_SIZE,
+    HTTP_POOL_IDLE_TIMEOUT,
+)
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'es-AR,es;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+class ProxyStats:
+    """Health record of a single proxy, fed by health checks and real requests."""
+    
+    # A proxy that failed this many times in a row is considered down until it passes a check
+    MAX_CONSECUTIVE_FAILURES = 2
+    
+    def __init__(self):
+        self.latency = None  # Exponentially weighted average response time (seconds)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.last_checked = 0.0
+    
+    def record(self, ok: bool, latency: float = None):
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.7 * self.latency + 0.3 * latency
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = time.time()
+    
+    @property
+    def healthy(self) -> bool:
+        return self.successes > 0 and self.consecutive_failures < self.MAX_CONSECUTIVE_FAILURES
+    
+    @property
+    def success_rate(self) -> float:
+        # Laplace smoothing so a single result doesn't dominate
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+    
+    def score(self) -> float:
+        """Higher is better: fast, reliable proxies that haven't failed recently."""
+        if not self.healthy:
+            return 0.0
+        score = self.success_rate / ((self.latency or PROXY_TIMEOUT) + 0.1)
+        if time.time() - self.last_failure < PROXY_HEALTH_CHECK_INTERVAL:
+            score *= 0.1
+        return score
+
 class ProxyManager:
     """Manages free proxy services and proxy rotation for web scraping."""
     
     def __init__(self):
         self.proxies = []
-        self.current_proxy_index = 0
         self.last_proxy_update = 0
         self.proxy_update_interval = PROXY_UPDATE_INTERVAL
         self.max_retries = PROXY_MAX_RETRIES
         self.use_proxy = USE_PROXY
         self.proxy_fallback = PROXY_FALLBACK
         
+        # Pooled keep-alive clients, one per proxy plus one for direct connections
+        self._sessions: Dict[str, requests.Session] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+        self._last_used: Dict[str, float] = {}
+        
+        # Scored proxy pool maintained by the background health checker
+        self.pool: set = set()  # Keys of the proxies requests are spread over
+        self.stats: Dict[str, ProxyStats] = {}
+        self.test_url = PROXY_TEST_URL
+        self.checked = asyncio.Event()  # Set once the first health check is done
+        
         if not self.use_proxy:
             logger.info("Proxy usage is disabled - using direct connections")
         elif not self.proxy_fallback:
             logger.info("Proxy fallback is disabled - will fail if no proxies are available")
         
+    @staticmethod
+    def _client_key(proxy: Optional[Dict[str, str]]) -> str:
+        return proxy['https'] if proxy else "direct"
+    
+    @staticmethod
+    def _metrics_label(key: str) -> str:
+        """host:port of the proxy with this client key, leaving any credentials out of the metrics."""
+        if key == "direct":
+            return key
+        parsed = urlparse(key)
+        return f"{parsed.hostname}:{parsed.port}" if parsed.port else str(parsed.hostname)
+    
+    def _record_request(self, proxy: Optional[Dict[str, str]], outcome: str):
+        requests_total.inc(proxy=self._metrics_label(self._client_key(proxy)), outcome=outcome)
+    
+    def _idle_keys(self, clients: dict) -> List[str]:
+        now = time.time()
+        return [key for key in clients if now - self._last_used.get(key, 0) > HTTP_POOL_IDLE_TIMEOUT]
+    
+    def get_session(self, proxy: Optional[Dict[str, str]] = None) -> requests.Session:
+        """Get the pooled requests session for a proxy (or for direct connections)."""
+        for key in self._idle_keys(self._sessions):
+            logger.debug(f"Closing idle session for {key}")
+            self._sessions.pop(key).close()
+        
+        key = self._client_key(proxy)
+        session = self._sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if proxy:
+                session.proxies.update(proxy)
+            self._sessions[key] = session
+        self._last_used[key] = time.time()
+        return session
+    
+    async def get_async_client(self, proxy: Optional[Dict[str, str]] = None) -> httpx.AsyncClient:
+        """Get the pooled httpx client for a proxy (or for direct connections)."""
+        for key in self._idle_keys(self._async_clients):
+            logger.debug(f"Closing idle async client for {key}")
+            await self._async_clients.pop(key).aclose()
+        
+        key = self._client_key(proxy)
+        client = self._async_clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                proxy=proxy['https'] if proxy else None,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE,
+                    keepalive_expiry=HTTP_POOL_IDLE_TIMEOUT,
+                ),
+            )
+            self._async_clients[key] = client
+        self._last_used[key] = time.time()
+        return client
+    
+    async def aclose(self):
+        """Close every pooled client."""
+        for session in self._sessions.values():
+            session.close()
+        for client in self._async_clients.values():
+            await client.aclose()
+        self._sessions.clear()
+        self._async_clients.clear()
+    
     def get_free_proxies(self) -> List[Dict[str, str]]:
         """Fetch free proxies from multiple sources."""
         if not self.use_proxy:
             return []
             
+        # A fixed proxy list (own proxies, or a local stub for benchmarks) replaces the free sources
+        if PROXY_LIST:
+            proxies = [proxy if "://" in proxy else f"http://{proxy}" for proxy in PROXY_LIST]
+            logger.info(f"Using {len(proxies)} proxies from PROXY_LIST")
+            return [{'http': proxy, 'https': proxy} for proxy in proxies]
+        
         proxy_list = []
         
         try:
@@ -90,35 +248,15 @@ class ProxyManager:
             logger.info("Updating proxy list...")
             self.proxies = self.get_free_proxies()
             self.last_proxy_update = current_time
-            self.current_proxy_index = 0
     
-    def get_next_proxy(self) -> Optional[Dict[str, str]]:
-        """Get the next proxy in rotation."""
-        if not self.use_proxy:
-            return None
-            
-        self.update_proxies()
-        
-        if not self.proxies:
-            if self.proxy_fallback:
-                logger.warning("No proxies available, using direct connection")
-            else:
-                logger.error("No proxies available and fallback is disabled")
-            return None
-        
-        proxy = self.proxies[self.current_proxy_index]
-        self.current_proxy_index = (self.current_proxy_index + 1) % len(self.proxies)
-        
-        return proxy
-    
-    def test_proxy(self, proxy: Dict[str, str], test_url: str = "https://httpbin.org/ip") -> bool:
+    def test_proxy(self, proxy: Dict[str, str], test_url: str = None) -> bool:
         """Test if a proxy is working."""
         if not self.use_proxy:
             return False
             
         try:
             response = requests.get(
-                test_url, 
+                test_url or self.test_url, 
                 proxies=proxy, 
                 timeout=PROXY_TIMEOUT,
                 headers={'User-Agent': 'Mozilla/5.0'}
@@ -128,93 +266,249 @@ class ProxyManager:
             logger.debug(f"Proxy test failed: {e}")
             return False
     
-    def get_working_proxy(self) -> Optional[Dict[str, str]]:
-        """Get a working proxy by testing multiple proxies."""
+    def record_result(self, proxy: Optional[Dict[str, str]], ok: bool, latency: float = None):
+        """Feed the outcome of a request through `proxy` into its health score."""
+        if proxy:
+            key = self._client_key(proxy)
+            self.stats.setdefault(key, ProxyStats()).record(ok, latency)
+            breaker = breakers.for_proxy(key)
+            if ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+    
+    async def _check_proxy(self, proxy: Dict[str, str], semaphore: asyncio.Semaphore):
+        stats = self.stats.setdefault(self._client_key(proxy), ProxyStats())
+        async with semaphore:
+            started_at = time.monotonic()
+            try:
+                # Fresh client on purpose: the check must not reuse a pooled connection
+                async with httpx.AsyncClient(proxy=proxy['https'], timeout=PROXY_TIMEOUT) as client:
+                    response = await client.get(self.test_url, headers={'User-Agent': 'Mozilla/5.0'})
+                ok = response.status_code == 200
+            except Exception as e:
+                logger.debug(f"Proxy health check failed for {proxy['https']}: {e}")
+                ok = False
+        self.record_result(proxy, ok, time.monotonic() - started_at if ok else None)
+        stats.last_checked = time.time()
+    
+    def _pooled(self) -> List[Dict[str, str]]:
+        return [proxy for proxy in self.proxies if self._client_key(proxy) in self.pool]
+    
+    async def check_proxies(self):
+        """Refresh the proxy list if needed, re-probe the pool and refill it from a sample of the list.
+        
+        Only the PROXY_POOL_SIZE best healthy proxies are kept. The rest of the
+        list (thousands of entries for the free sources) is only sampled,
+        PROXY_CHECK_SAMPLE at a time, while the pool is short.
+        """
         if not self.use_proxy:
-            return None
-            
-        self.update_proxies()
+            return
         
-        if not self.proxies:
-            if self.proxy_fallback:
-                logger.warning("No proxies available, will use direct connection")
-            else:
-                logger.error("No proxies available and fallback is disabled")
+        # Fetching the proxy lists is synchronous, keep it off the event loop
+        await asyncio.to_thread(self.update_proxies)
+        
+        pooled = self._pooled()
+        healthy = sum(1 for proxy in pooled if self.stats.get(self._client_key(proxy), ProxyStats()).healthy)
+        candidates = [proxy for proxy in self.proxies if self._client_key(proxy) not in self.pool]
+        sample = random.sample(candidates, min(len(candidates), PROXY_CHECK_SAMPLE)) if healthy < PROXY_POOL_SIZE else []
+        
+        semaphore = asyncio.Semaphore(PROXY_HEALTH_CHECK_CONCURRENCY)
+        probed = pooled + sample
+        await asyncio.gather(*(self._check_proxy(proxy, semaphore) for proxy in probed))
+        
+        scored = sorted(((self._client_key(proxy), self.stats[self._client_key(proxy)].score()) for proxy in probed),
+                        key=lambda item: item[1], reverse=True)
+        self.pool = {key for key, score in scored[:PROXY_POOL_SIZE] if score > 0}
+        # Forget the proxies outside the pool, or their stats, breakers and metric series would pile up
+        for key in list(self.stats):
+            if key not in self.pool:
+                del self.stats[key]
+        breakers.retain_proxies(self.pool)
+        requests_total.retain("proxy", {self._metrics_label(key) for key in self.pool | {"direct"}})
+        logger.info(f"Proxy health check: {len(self.pool)} proxies in the pool, probed {len(probed)} of {len(self.proxies)}")
+    
+    async def run_health_checks(self, interval: int = PROXY_HEALTH_CHECK_INTERVAL):
+        """Background task that keeps the scored proxy pool up to date."""
+        while True:
+            try:
+                await self.check_proxies()
+            except Exception as e:
+                logger.error(f"[ERROR] Proxy health check failed: {e}")
+            self.checked.set()
+            await asyncio.sleep(interval)
+    
+    def ranked_proxies(self) -> List[tuple]:
+        """The pooled proxies with their health score, best first."""
+        ranked = []
+        for proxy in self._pooled():
+            key = self._client_key(proxy)
+            stats = self.stats.get(key)
+            # Proxies with an open circuit are skipped until their backoff elapses
+            usable = stats and breakers.for_proxy(key).ready()
+            ranked.append((proxy, stats.score() if usable else 0.0))
+        return sorted(ranked, key=lambda item: item[1], reverse=True)
+    
+    def get_working_proxy(self) -> Optional[Dict[str, str]]:
+        """Pick a healthy proxy from the scored pool, without probing.
+        
+        Requests rotate over the whole pool, weighted by score, so the best
+        proxies carry most of the traffic without all of it going through one.
+        """
+        if not self.use_proxy:
             return None
         
-        # Test up to 5 proxies to find a working one
-        for _ in range(min(5, len(self.proxies))):
-            proxy = self.get_next_proxy()
-            if proxy and self.test_proxy(proxy):
-                logger.info(f"Found working proxy: {proxy}")
-                return proxy
+        ranked = [(proxy, score) for proxy, score in self.ranked_proxies() if score > 0]
+        if ranked:
+            proxies, scores = zip(*ranked)
+            return random.choices(proxies, weights=scores)[0]
         
-        logger.warning("No working proxies found")
+        if self.proxy_fallback:
+            logger.warning("No healthy proxies available, will use direct connection")
+        else:
+            logger.error("No healthy proxies available and fallback is disabled")
         return None
     
+    def _select_proxy(self, url: str) -> tuple:
+        """Pick the proxy for the next attempt: (proxy or None, whether a request may be made)."""
+        if not self.use_proxy:
+            return None, True
+        proxy = self.get_working_proxy()
+        if proxy:
+            # Claims the proxy's trial if its circuit is half-open
+            breakers.for_proxy(self._client_key(proxy)).allow()
+        if proxy or self.proxy_fallback:
+            return proxy, True
+        # No proxy available and fallback is disabled
+        logger.error(f"No working proxies available and fallback is disabled for {url}")
+        return None, False
+    
+    def _release_proxy(self, proxy: Optional[Dict[str, str]]):
+        """Hand back the proxy's half-open trial when the outcome says nothing about the proxy."""
+        if proxy:
+            breakers.for_proxy(self._client_key(proxy)).release()
+    
+    def _handle_response(self, url: str, proxy: Optional[Dict[str, str]], status: int, headers, latency: float) -> str:
+        """Update breakers and scores for a response: returns "ok", "retry" or "give_up"."""
+        host_breaker = breakers.for_host(url)
+        stage_seconds.observe(latency, stage="fetch")
+        if status < 400:
+            self._record_request(proxy, "ok")
+            self.record_result(proxy, True, latency)
+            host_breaker.record_success()
+            return "ok"
+        if status in (429, 503):
+            # The target is rate-limiting or overloaded: back off the host, the proxy did its job
+            self._record_request(proxy, "rate_limited")
+            self.record_result(proxy, True, latency)
+            host_breaker.record_failure(parse_retry_after(headers.get('Retry-After')))
+            logger.warning(f"{url} answered {status}, backing off {host_breaker.name}")
+            return "retry"
+        if status == 403 and proxy:
+            # Most likely this proxy's IP is blocked
+            self._record_request(proxy, "blocked")
+            self.record_result(proxy, False)
+            host_breaker.release()
+            logger.warning(f"{url} answered 403 through {proxy['https']}")
+            return "retry"
+        if status >= 500:
+            self._record_request(proxy, "server_error")
+            host_breaker.record_failure()
+            self._release_proxy(proxy)
+            logger.warning(f"{url} answered {status}")
+            return "retry"
+        # Any other client error won't change by retrying
+        self._record_request(proxy, "client_error")
+        host_breaker.release()
+        self._release_proxy(proxy)
+        logger.warning(f"{url} answered {status}, not retrying")
+        return "give_up"
+    
+    def _handle_error(self, url: str, proxy: Optional[Dict[str, str]], error: Exception):
+        """Blame a connection error on the proxy, or on the host for direct requests."""
+        self._record_request(proxy, "error")
+        if proxy:
+            self.record_result(proxy, False)
+            breakers.for_host(url).release()
+        else:
+            breakers.for_host(url).record_failure()
+    
     def make_request_with_proxy(self, url: str, headers: Dict[str, str] = None, timeout: int = None) -> Optional[requests.Response]:
         """Make a request using a working proxy with retry logic."""
         if timeout is None:
             timeout = PROXY_TIMEOUT
             
         if headers is None:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'es-AR,es;q=0.9,en;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
+            headers = DEFAULT_HEADERS
         
+        host_breaker = breakers.for_host(url)
         for attempt in range(self.max_retries):
+            if not host_breaker.allow():
+                logger.warning(f"Circuit open for {host_breaker.name}, skipping {url} ({host_breaker.remaining():.0f}s left)")
+                return None
+            
+            proxy, allowed = self._select_proxy(url)
+            if not allowed:
+                return None
+            
             try:
-                if self.use_proxy:
-                    proxy = self.get_working_proxy()
-                    
-                    if proxy:
-                        logger.debug(f"Making request with proxy (attempt {attempt + 1})")
-                        response = requests.get(
-                            url, 
-                            headers=headers, 
-                            proxies=proxy, 
-                            timeout=timeout
-                        )
-                        response.raise_for_status()
-                        return response
-                    elif self.proxy_fallback:
-                        # Fallback to direct connection only if enabled
-                        logger.debug(f"Making direct request (attempt {attempt + 1})")
-                        response = requests.get(
-                            url, 
-                            headers=headers, 
-                            timeout=timeout
-                        )
-                        response.raise_for_status()
-                        return response
-                    else:
-                        # No proxy available and fallback is disabled
-                        logger.error(f"No working proxies available and fallback is disabled for {url}")
-                        return None
-                else:
-                    # Proxy usage is disabled, use direct connection
-                    logger.debug(f"Making direct request (attempt {attempt + 1})")
-                    response = requests.get(
-                        url, 
-                        headers=headers, 
-                        timeout=timeout
-                    )
-                    response.raise_for_status()
+                logger.debug(f"Making {'proxied' if proxy else 'direct'} request (attempt {attempt + 1})")
+                started_at = time.monotonic()
+                response = self.get_session(proxy).get(url, headers=headers, timeout=timeout)
+                outcome = self._handle_response(url, proxy, response.status_code, response.headers, time.monotonic() - started_at)
+                if outcome == "ok":
                     return response
-                    
+                if outcome == "give_up":
+                    return None
             except requests.RequestException as e:
                 logger.warning(f"Request failed (attempt {attempt + 1}): {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(random.uniform(1, 3))  # Random delay between retries
-                else:
-                    logger.error(f"All request attempts failed for {url}")
-                    return None
+                self._handle_error(url, proxy, e)
+            
+            if attempt < self.max_retries - 1:
+                time.sleep(backoff_delay(attempt))
         
+        logger.error(f"All request attempts failed for {url}")
+        return None
+
+    async def make_async_request_with_proxy(self, url: str, headers: Dict[str, str] = None, timeout: int = None) -> Optional[httpx.Response]:
+        """Async counterpart of make_request_with_proxy built on httpx.
+
+        Retry delays use asyncio.sleep, so the event loop is never blocked.
+        """
+        if timeout is None:
+            timeout = PROXY_TIMEOUT
+
+        if headers is None:
+            headers = DEFAULT_HEADERS
+
+        host_breaker = breakers.for_host(url)
+        for attempt in range(self.max_retries):
+            if not host_breaker.allow():
+                logger.warning(f"Circuit open for {host_breaker.name}, skipping {url} ({host_breaker.remaining():.0f}s left)")
+                return None
+
+            proxy, allowed = self._select_proxy(url)
+            if not allowed:
+                return None
+
+            try:
+                logger.debug(f"Making async {'proxied' if proxy else 'direct'} request (attempt {attempt + 1})")
+                client = await self.get_async_client(proxy)
+                started_at = time.monotonic()
+                response = await client.get(url, headers=headers, timeout=timeout)
+                outcome = self._handle_response(url, proxy, response.status_code, response.headers, time.monotonic() - started_at)
+                if outcome == "ok":
+                    return response
+                if outcome == "give_up":
+                    return None
+            except httpx.HTTPError as e:
+                logger.warning(f"Async request failed (attempt {attempt + 1}): {e}")
+                self._handle_error(url, proxy, e)
+
+            if attempt < self.max_retries - 1:
+                await asyncio.sleep(backoff_delay(attempt))
+
+        logger.error(f"All async request attempts failed for {url}")
         return None
 
 # Global proxy manager instance
@@ -0,0 +1,102 @@
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import select
+
+from database import AsyncSessionLocal, Watchlist, BotState, SearchGeneration
+
+logger = logging.getLogger(__name__)
+
+class WatchlistRegistry:
+    """Process-local copy of the watchlist, grouped by search URL, and of the chats' bot states.
+
+    Loaded from the database once at startup; the handlers update it right
+    after their writes are committed, so the monitor and /list read it
+    instead of the database. Worker processes don't see the front-end's
+    handlers and reload it on every watchlist sync instead.
+
+    It also mirrors each search's state generation, bumped in the database
+    whenever its stored state is invalidated (new follower, cleared seen ads,
+    resumed chat). A check that starts from the registry's generation only
+    saves its state if the database still holds the same one, so neither a
+    handler running meanwhile nor a follower this registry doesn't know of
+    yet gets their invalidation undone.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._by_id: Dict[int, Watchlist] = {}
+        self._by_url: Dict[str, Dict[int, Watchlist]] = {}
+        self._running: Dict[str, bool] = {}
+        self._state_generations: Dict[str, int] = {}
+
+    async def load(self):
+        async with AsyncSessionLocal() as session:
+            entries = (await session.scalars(select(Watchlist))).all()
+            running = dict((await session.execute(select(BotState.chat_id, BotState.is_running))).all())
+            generations = dict((await session.execute(select(SearchGeneration.url, SearchGeneration.generation))).all())
+        by_url = {}
+        for entry in entries:
+            by_url.setdefault(entry.url, {})[entry.id] = entry
+        # Swap everything at once so readers never see a half-loaded registry
+        self._by_id = {entry.id: entry for entry in entries}
+        self._by_url = by_url
+        self._running = running
+        self._state_generations = generations
+        if not self.loaded:
+            logger.info(f"Loaded {len(entries)} watchlist entries for {len(by_url)} searches")
+        self.loaded = True
+
+    def add(self, entry: Watchlist):
+        self._by_id[entry.id] = entry
+        self._by_url.setdefault(entry.url, {})[entry.id] = entry
+
+    def remove(self, entry_id: int) -> Optional[Watchlist]:
+        entry = self._by_id.pop(entry_id, None)
+        if entry:
+            followers = self._by_url.get(entry.url, {})
+            followers.pop(entry_id, None)
+            if not followers:
+                self._by_url.pop(entry.url, None)
+        return entry
+
+    def get(self, entry_id: int) -> Optional[Watchlist]:
+        return self._by_id.get(entry_id)
+
+    def find(self, chat_id: str, url: str) -> Optional[Watchlist]:
+        return next((entry for entry in self.entries_for_url(url) if entry.chat_id == chat_id), None)
+
+    def entries_for_url(self, url: str) -> list[Watchlist]:
+        return list(self._by_url.get(url, {}).values())
+
+    def entries_for_chat(self, chat_id: str) -> list[Watchlist]:
+        return [entry for entry in self._by_id.values() if entry.chat_id == chat_id]
+
+    def urls(self) -> list[str]:
+        return list(self._by_url)
+
+    def title_for(self, url: str) -> Optional[str]:
+        """A known title of the search, if anyone following it has one."""
+        return next((entry.title for entry in self.entries_for_url(url) if entry.title), None)
+
+    def set_title(self, url: str, title: str):
+        """Fill in the title of the search's entries that don't have one yet."""
+        for entry in self.entries_for_url(url):
+            if entry.title is None:
+                entry.title = title
+
+    def state_generation(self, url: str) -> int:
+        return self._state_generations.get(url, 0)
+
+    def set_state_generations(self, generations: Dict[str, int]):
+        self._state_generations.update(generations)
+
+    def is_running(self, chat_id: str) -> bool:
+        # Chats without a BotState row are running
+        return self._running.get(chat_id, True)
+
+    def set_running(self, chat_id: str, is_running: bool):
+        self._running[chat_id] = is_running
+
+# Global registry, loaded by main before the handlers and the monitor start
+registry = WatchlistRegistry()
@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from config import HOST_CONCURRENCY, REQUEST_RATE, REQUEST_BURST
+from metrics import queue_depth, schedule_lag_seconds
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Async token bucket: allows `capacity` requests at once, refilled at `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Wait until a token is available and consume it."""
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                logger.debug(f"Token bucket empty, waiting {wait:.2f} seconds")
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+
+class HostLimiter:
+    """Limits concurrent requests and request rate independently for each host."""
+
+    def __init__(self, concurrency: int, rate: float, burst: int):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Hold one of the host's request slots, paced by its token bucket."""
+        host = urlparse(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.concurrency)
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        async with self._semaphores[host]:
+            await self._buckets[host].acquire()
+            yield
+
+class DueQueue:
+    """Priority queue of keys (search URLs) ordered by their next due time.
+
+    A key is never handed out twice at once: scheduling a key that is being
+    processed is remembered and applied when `done` is called for it.
+    """
+
+    def __init__(self):
+        self._heap: list = []
+        self._due: Dict[str, float] = {}
+        self._running: set = set()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._due or key in self._running
+
+    def busy(self) -> bool:
+        """Whether a key is being processed or is already due."""
+        return bool(self._running) or self.overdue() > 0
+
+    def overdue(self) -> int:
+        """Number of keys already due and waiting to be handed out."""
+        now = time.time()
+        return sum(1 for due_at in self._due.values() if due_at <= now)
+
+    def _push(self, key: str, due_at: float):
+        self._due[key] = due_at
+        heapq.heappush(self._heap, (due_at, key))
+        self._wakeup.set()
+
+    def schedule(self, key: str, due_at: float):
+        """Schedule `key` at `due_at`, unless it is already due earlier."""
+        current = self._due.get(key)
+        if current is not None and current <= due_at:
+            return
+        if key in self._running:
+            # Picked up by done() once the running check finishes
+            self._due[key] = due_at
+        else:
+            self._push(key, due_at)
+
+    def schedule_now(self, key: str):
+        self.schedule(key, time.time())
+
+    def discard(self, key: str):
+        """Stop scheduling `key` (its stale heap entries are skipped lazily)."""
+        self._due.pop(key, None)
+
+    def retain(self, keys):
+        """Discard every scheduled key that is not in `keys`."""
+        keys = set(keys)
+        for key in [key for key in self._due if key not in keys]:
+            self.discard(key)
+
+    def done(self, key: str, next_due: Optional[float]):
+        """Mark `key` as processed and schedule it again at `next_due` (None to drop it)."""
+        self._running.discard(key)
+        pending = self._due.pop(key, None)
+        candidates = [due for due in (pending, next_due) if due is not None]
+        if candidates:
+            self._push(key, min(candidates))
+
+    async def pop_due(self) -> str:
+        """Wait for the earliest key to become due, mark it as running and return it."""
+        while True:
+            # Skip entries that were rescheduled or discarded since they were pushed
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            now = time.time()
+            if self._heap and self._heap[0][0] <= now:
+                due_at, key = heapq.heappop(self._heap)
+                schedule_lag_seconds.observe(now - due_at)
+                del self._due[key]
+                self._running.add(key)
+                return key
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+# Global per-host limiter shared by every scraping request
+host_limiter = HostLimiter(HOST_CONCURRENCY, REQUEST_RATE, REQUEST_BURST)
+
+# Global queue of searches by next due time, fed by the monitor and the handlers
+due_queue = DueQueue()
+queue_depth.track(lambda: len(due_queue), queue="scheduled")
+queue_depth.track(due_queue.overdue, queue="due")
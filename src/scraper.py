@@ -1,13 +1,13 @@
 import re
 import time
 import random
+import hashlib
 from urllib.parse import urlparse, urlunparse
-import requests
-from bs4 import BeautifulSoup
 import logging
 
 from config import REQUEST_DELAY_MIN, REQUEST_DELAY_MAX
 from proxy_manager import proxy_manager
+from extract import ITEM_ID_REGEX, parse_listings, parse_search_page, parse_title, parse_car_details
 
 logger = logging.getLogger(__name__)
 
@@ -17,28 +17,48 @@ def transform_listado_to_autos(url: str) -> str:
     """Transform listado.mercadolibre.com.ar URLs to autos.mercadolibre.com.ar"""
     return url.replace("listado.mercadolibre.com.ar", "autos.mercadolibre.com.ar")
 
+def get_item_id(ad_link: str) -> str:
+    """Extract the MercadoLibre item ID (e.g. MLA1234567) from an ad link."""
+    match = ITEM_ID_REGEX.search(ad_link)
+    if match:
+        return match.group(1) + match.group(2)
+    # Unknown link format: fall back to the link without query string or fragment
+    return ad_link.split("#")[0].split("?")[0]
+
+def ad_hash(ad_link: str) -> int:
+    """Signed 64-bit hash of the ad's item ID, used as its compact seen-ads key."""
+    digest = hashlib.blake2b(get_item_id(ad_link).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
 def _add_request_delay():
     """Add a random delay between requests to be respectful to MercadoLibre servers."""
     delay = random.uniform(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX)
     logger.debug(f"Adding delay of {delay:.2f} seconds between requests")
     time.sleep(delay)
 
-def get_listings(url: str) -> list[str]:
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "es-AR,es;q=0.9,en;q=0.8",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+CAR_DETAILS_ERROR_TITLE = "Error al cargar"
+
+def car_details_error(url: str) -> dict:
+    """Placeholder details used when a listing page could not be fetched."""
+    return {"title": CAR_DETAILS_ERROR_TITLE, "price": "N/A", "year": "N/A", "kilometers": "N/A", "location": "N/A", "url": url}
+
+def get_listings(url: str, cards: bool = False) -> list:
+    """Ad links of a search page, or its parsed listing cards (dicts of car fields) with `cards=True`."""
     # Transform listado URLs to autos URLs
     url = transform_listado_to_autos(url)
     
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "es-AR,es;q=0.9,en;q=0.8",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
-    
     try:
         # Use proxy manager for the request
-        res = proxy_manager.make_request_with_proxy(url, headers=headers, timeout=15)
+        res = proxy_manager.make_request_with_proxy(url, headers=HEADERS, timeout=15)
         if res is None:
             logger.error(f"Failed to fetch URL {url} with proxy")
             return []
@@ -46,12 +66,9 @@ def get_listings(url: str) -> list[str]:
         logger.error(f"Failed to fetch URL {url}: {e}")
         return []
 
-    soup = BeautifulSoup(res.text, "lxml")
-    published_today = len(soup.find_all(string="Publicados hoy")) > 0
-    if published_today:
-        anchors = soup.select("a.poly-component__title")
-        return [a["href"].split("#")[0] for a in anchors if a.get("href")]
-    return []
+    if cards:
+        return list(parse_search_page(res.text, url)["cards"].values())
+    return parse_listings(res.text)
 
 def ensure_published_today_filter(url: str) -> str:
     # Transform listado URLs to autos URLs first
@@ -76,30 +93,14 @@ def get_title_from_url(url: str) -> str:
     # Add delay before making request
     _add_request_delay()
     
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "es-AR,es;q=0.9",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
-    
     try:
         # Use proxy manager for the request
-        res = proxy_manager.make_request_with_proxy(url, headers=headers, timeout=10)
+        res = proxy_manager.make_request_with_proxy(url, headers=HEADERS, timeout=10)
         if res is None:
             logger.warning(f"Failed to fetch title for {url} with proxy")
             return url
             
-        soup = BeautifulSoup(res.text, "lxml")
-
-        title_tag = soup.find("title")
-        if not title_tag:
-            return url
-
-        title = title_tag.text.strip().replace(" | MercadoLibre", "")
-        return title if title else url
+        return parse_title(res.text, url)
     except Exception as e:
         logger.warning(f"Failed to fetch title for {url}: {e}")
         return url
@@ -112,73 +113,14 @@ def get_car_details(url: str) -> dict:
     # Add delay before making request
     _add_request_delay()
     
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "es-AR,es;q=0.9,en;q=0.8",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
-    
     try:
         # Use proxy manager for the request
-        res = proxy_manager.make_request_with_proxy(url, headers=headers, timeout=15)
+        res = proxy_manager.make_request_with_proxy(url, headers=HEADERS, timeout=15)
         if res is None:
             logger.error(f"Failed to fetch car details from {url} with proxy")
-            return {"title": "Error al cargar", "price": "N/A", "year": "N/A", "kilometers": "N/A", "location": "N/A", "url": url}
+            return car_details_error(url)
     except Exception as e:
         logger.error(f"Failed to fetch car details from {url}: {e}")
-        return {"title": "Error al cargar", "price": "N/A", "year": "N/A", "kilometers": "N/A", "location": "N/A", "url": url}
+        return car_details_error(url)
 
-    soup = BeautifulSoup(res.text, "lxml")
-    
-    # Extract title
-    title = "Sin título"
-    title_tag = soup.find("title")
-    if title_tag:
-        title = title_tag.text.strip().replace(" | MercadoLibre", "")
-    
-    # Extract price
-    price = "Precio no disponible"
-    price_elements = soup.select(".andes-money-amount__fraction")
-    if price_elements:
-        price = price_elements[0].text.strip()
-        # Check for currency symbol
-        currency_elements = soup.select(".andes-money-amount__currency-symbol")
-        if currency_elements:
-            currency = currency_elements[0].text.strip()
-            price = f"{currency} {price}"
-    
-    # Extract year and kilometers from "Publicado hace" string
-    year = "Año no disponible"
-    kilometers = "KM no disponible"
-    
-    page_text = soup.get_text()
-    
-    # Look for the "Publicado hace" pattern
-    publicado_pattern = r"(\d{4})\s*\|\s*([\d.,]+)\s*km\s*·\s*Publicado"
-    match = re.search(publicado_pattern, page_text)
-    if match:
-        year = match.group(1)
-        kilometers = match.group(2)
-    
-    # Extract location from JSON data
-    location = "Ubicación no disponible"
-    
-    # Look for location in JSON format from the actual page content
-    json_location_pattern = r'"city":"([^"]+)","neighborhood":"([^"]+)","state":"([^"]+)"'
-    match = re.search(json_location_pattern, page_text)
-    if match:
-        city = match.group(1)
-        state = match.group(3)
-        location = f"{city}, {state}"
-    
-    return {
-        "title": title,
-        "price": price,
-        "year": year,
-        "kilometers": kilometers,
-        "location": location,
-        "url": url
-    }
\ No newline at end of file
+    return parse_car_details(res.text, url)
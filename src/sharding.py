@@ -0,0 +1,123 @@
+import hashlib
+import math
+import os
+import socket
+import time
+import logging
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, ShardLease, WorkerHeartbeat
+from config import SHARD_COUNT, LEASE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Sharded monitoring: search URLs are hashed into SHARD_COUNT shards and every
+# shard is leased to one worker at a time through the shard_lease table.
+# Workers heartbeat, renew their leases every refresh and balance the shards
+# among themselves; the shards of a worker that stops renewing expire after
+# LEASE_TTL seconds and are claimed by the others.
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def shard_of(url: str, shard_count: int = SHARD_COUNT) -> int:
+    """Stable shard of a search URL, the same in every process and machine."""
+    digest = hashlib.blake2b(url.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+class ShardLeases:
+    """The set of shards leased to one worker, kept up to date by `refresh`."""
+
+    def __init__(self, worker_id: str = None, shard_count: int = SHARD_COUNT, ttl: int = LEASE_TTL):
+        self.worker_id = worker_id or default_worker_id()
+        self.shard_count = shard_count
+        self.ttl = ttl
+        self.owned: set[int] = set()
+
+    def owns(self, url: str) -> bool:
+        return shard_of(url, self.shard_count) in self.owned
+
+    def _create_shards(self):
+        session = SessionLocal()
+        try:
+            existing = {shard for (shard,) in session.query(ShardLease.shard)}
+            missing = [shard for shard in range(self.shard_count) if shard not in existing]
+            if missing:
+                session.add_all(ShardLease(shard=shard, owner=None, expires_at=0.0) for shard in missing)
+                session.commit()
+        except IntegrityError:
+            # Another worker created them at the same time
+            session.rollback()
+        finally:
+            session.close()
+
+    def refresh(self) -> set[int]:
+        """Heartbeat, renew our leases and claim or release shards to even out the load.
+
+        Synchronous (database I/O), run it in a thread. Returns the shards we own.
+        """
+        self._create_shards()
+        now = time.time()
+        session = SessionLocal()
+        try:
+            session.query(WorkerHeartbeat).filter(
+                WorkerHeartbeat.seen_at < now - self.ttl, WorkerHeartbeat.worker_id != self.worker_id
+            ).delete(synchronize_session=False)
+            session.merge(WorkerHeartbeat(worker_id=self.worker_id, seen_at=now))
+            session.flush()
+
+            live_workers = max(1, session.query(WorkerHeartbeat).count())
+            target = math.ceil(self.shard_count / live_workers)
+
+            # Renew every lease still in our name
+            session.query(ShardLease).filter(ShardLease.owner == self.worker_id).update(
+                {"expires_at": now + self.ttl}, synchronize_session=False
+            )
+            owned = {shard for (shard,) in session.query(ShardLease.shard).filter(ShardLease.owner == self.worker_id)}
+
+            # Give back shards above our fair share so new workers can take them
+            if len(owned) > target:
+                extra = sorted(owned)[target:]
+                session.query(ShardLease).filter(
+                    ShardLease.shard.in_(extra), ShardLease.owner == self.worker_id
+                ).update({"owner": None, "expires_at": 0.0}, synchronize_session=False)
+                owned -= set(extra)
+
+            # Claim free or expired shards up to our fair share; the conditional
+            # update makes sure only one worker wins each shard
+            if len(owned) < target:
+                free = [
+                    shard for (shard,) in session.query(ShardLease.shard)
+                    .filter(or_(ShardLease.owner.is_(None), ShardLease.expires_at < now))
+                    .order_by(ShardLease.shard)
+                ]
+                for shard in free[:target - len(owned)]:
+                    claimed = session.query(ShardLease).filter(
+                        ShardLease.shard == shard,
+                        or_(ShardLease.owner.is_(None), ShardLease.expires_at < now),
+                    ).update({"owner": self.worker_id, "expires_at": now + self.ttl}, synchronize_session=False)
+                    if claimed:
+                        owned.add(shard)
+            session.commit()
+        finally:
+            session.close()
+
+        if owned != self.owned:
+            logger.info(f"Worker {self.worker_id} owns {len(owned)}/{self.shard_count} shards ({live_workers} workers)")
+        self.owned = owned
+        return owned
+
+    def release(self):
+        """Hand all our shards back, e.g. on shutdown."""
+        session = SessionLocal()
+        try:
+            session.query(ShardLease).filter(ShardLease.owner == self.worker_id).update(
+                {"owner": None, "expires_at": 0.0}, synchronize_session=False
+            )
+            session.query(WorkerHeartbeat).filter(WorkerHeartbeat.worker_id == self.worker_id).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+        self.owned = set()
@@ -1,11 +1,23 @@
 import asyncio
 import logging
-import time
 import random
+import time
+from typing import Optional
+from sqlalchemy import delete, insert, select, update
 
-from database import SessionLocal, SeenAd, Watchlist, BotState
-from scraper import get_listings, get_car_details
-from config import REQUEST_DELAY_MIN, REQUEST_DELAY_MAX
+from database import AsyncSessionLocal, SeenAd, Watchlist, SearchState, SearchSchedule, SearchGeneration, Outbox, purge_seen_ads, compact_database
+from async_scraper import fetch_search_page, get_car_details, get_title_from_url
+from scraper import ad_hash
+from scheduler import due_queue
+from cache import detail_cache
+from delivery import delivery_queue
+from writer import db_writer
+from registry import registry
+from metrics import stage_seconds, check_seconds, cycle_seconds, check_interval_seconds, new_ads_total
+from circuit_breaker import breakers
+from polling import new_schedule, update_schedule, skip_learning, retry_later, budget_scale, START_INTERVAL
+from sharding import ShardLeases
+from config import SCRAPE_WORKERS, SEEN_AD_RETENTION_DAYS, MIN_CHECK_INTERVAL, SEARCH_MAX_PAGES
 
 logger = logging.getLogger(__name__)
 
@@ -26,39 +38,344 @@ def format_car_message(car_details: dict) -> str:
     
     return message
 
-async def check_for_new_ads(app, check_interval: int):
-    while True:
-        session = SessionLocal()
-        watchlist = session.query(Watchlist).all()
+async def save_search_state(session, url: str, page, complete: bool = True):
+    """Remember the first page's validators and fingerprint for the next check.
+
+    After an incomplete crawl (later pages still hold unseen ads) nothing is
+    remembered, so the next check doesn't stop at an unchanged first page.
+    """
+    if complete:
+        await session.merge(SearchState(url=url, etag=page.etag, last_modified=page.last_modified, fingerprint=page.fingerprint))
+    else:
+        await session.merge(SearchState(url=url, etag=None, last_modified=None, fingerprint=None))
+
+async def state_still_current(session, url: str, generation: int) -> bool:
+    """Whether the search's state generation in the database is still the one a check started from.
+    
+    If it isn't, a handler (in this or the front-end process) invalidated the
+    stored state after the check's follower list was taken, and the check
+    must not write its state back.
+    """
+    current = await session.get(SearchGeneration, url)
+    return (current.generation if current else 0) == generation
+
+async def drop_orphaned_searches(session, urls):
+    """Delete stored per-search state for URLs nobody follows anymore."""
+    for model in (SearchState, SearchSchedule, SearchGeneration):
+        await session.execute(delete(model).where(model.url.notin_(urls)))
+
+async def get_listing_details(ad: str, card: Optional[dict]) -> dict:
+    """Car details from the ad's search result card, fetching the detail page only for missing fields."""
+    if card and all(card.values()):
+        return card
+    details = await detail_cache.get(ad, get_car_details)
+    if not card:
+        return details
+    return {field: value or details.get(field) for field, value in card.items()}
+
+async def check_search(url: str, entries: list[Watchlist], running: dict[str, bool], state: SearchState = None, generation: int = 0):
+    """Scrape one search URL once and notify every subscribed chat about its unseen ads.
+    
+    `generation` is the registry's state generation of the URL, taken with
+    `entries`. Returns the number of new ads found, or None if the
+    search wasn't checked.
+    """
+    # Only keep chats whose bot is running (chats without a BotState row are running)
+    active = [entry for entry in entries if running.get(entry.chat_id, True)]
+    if not active:
+        logger.debug(f"Bot is stopped for every user following {url}, skipping")
+        return None
+    
+    # Don't hammer a host that is rate-limiting us or failing
+    host_breaker = breakers.for_host(url)
+    if not host_breaker.ready():
+        logger.info(f"Circuit open for {host_breaker.name}, skipping {url} this cycle")
+        return None
+    
+    if state:
+        page = await fetch_search_page(url, state.etag, state.last_modified, state.fingerprint)
+    else:
+        page = await fetch_search_page(url)
+    if page is None:
+        return None
+    
+    try:
+        if not page.changed:
+            # Nothing new since the last check: skip parsing and the seen-ad comparison
+            if state and (page.etag, page.last_modified) != (state.etag, state.last_modified):
+                async def save_validators(session):
+                    if await state_still_current(session, url, generation):
+                        await save_search_state(session, url, page)
+                await db_writer.write(save_validators)
+            return 0
         
-        for entry in watchlist:
-            try:
-                # Check if bot is running for this user
-                bot_state = session.query(BotState).filter_by(chat_id=entry.chat_id).first()
-                if bot_state and not bot_state.is_running:
-                    logger.debug(f"Bot is stopped for user {entry.chat_id}, skipping notifications")
+        logger.debug(f"{url}: {len(page.ads)} ads on the first page, {page.result_count} results in total")
+        new_rows = []
+        outbox_rows = []
+        new_ads = 0
+        seen = set()
+        now = int(time.time())
+        # Entries that haven't seen any ad of this search yet (new followers,
+        # cleared seen ads) are only notified about the first page: the pages
+        # after it hold the backlog they followed on top of, not ads they missed
+        with stage_seconds.time(stage="db"):
+            async with AsyncSessionLocal() as session:
+                known = set(await session.scalars(
+                    select(SeenAd.watchlist_id).where(SeenAd.watchlist_id.in_([entry.id for entry in active])).distinct()
+                ))
+        readers = {entry.id for entry in active}  # Entries still notified, the others' ads are marked seen silently
+        current = page
+        fetched = 1
+        complete = True
+        # The last crawl stopped early, so unseen ads may sit past pages that
+        # hold nothing new: keep following those until the crawl gets through
+        resuming = state is not None and state.fingerprint is None
+        while True:
+            # Load which of this page's ads each entry has already seen in one query
+            hashes = {ad: ad_hash(ad) for ad in current.ads}
+            with stage_seconds.time(stage="db"):
+                async with AsyncSessionLocal() as session:
+                    seen.update(
+                        await session.execute(
+                            select(SeenAd.watchlist_id, SeenAd.item_hash)
+                            .where(
+                                SeenAd.watchlist_id.in_([entry.id for entry in active]),
+                                SeenAd.item_hash.in_(set(hashes.values())),
+                            )
+                        )
+                    )
+            
+            # Established entries that found something new here read on
+            following = set()
+            for ad in current.ads:
+                chats = []
+                for entry in active:
+                    key = (entry.id, hashes[ad])
+                    if key in seen:
+                        logger.debug(f"Ad already seen by {entry.chat_id}: {ad}")
+                        continue
+                    seen.add(key)
+                    new_rows.append({"watchlist_id": entry.id, "item_hash": hashes[ad], "seen_at": now})
+                    if entry.id not in readers:
+                        # Past the page where this entry stopped, so it's an old ad to it
+                        continue
+                    chats.append(entry.chat_id)
+                    if entry.id in known:
+                        following.add(entry.id)
+                if not chats:
                     continue
+                new_ads += 1
+                
+                # Get detailed car information once for every chat that needs it
+                car_details = await get_listing_details(ad, current.cards.get(ad))
+                message = format_car_message(car_details)
                 
-                ads = get_listings(entry.url)
-                for ad in ads:
-                    exists = session.query(SeenAd).filter_by(chat_id=entry.chat_id, url=entry.url, ad_link=ad).first()
-                    if not exists:
-                        session.add(SeenAd(chat_id=entry.chat_id, url=entry.url, ad_link=ad))
-                        
-                        # Get detailed car information
-                        car_details = get_car_details(ad)
-                        message = format_car_message(car_details)
-                        
-                        await app.bot.send_message(chat_id=int(entry.chat_id), text=message)
-                        
-                        # Add a delay between processing ads to be respectful
-                        delay = random.uniform(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX)
-                        logger.debug(f"Adding delay of {delay:.2f} seconds between ads")
-                        await asyncio.sleep(delay)
-                    else:
-                        logger.debug(f"Ad already seen: {ad}")
-                session.commit()
+                outbox_rows.extend({"chat_id": chat_id, "text": message, "created_at": now} for chat_id in chats)
+            
+            # Follow the _Desde_N pagination until a page holds nothing new:
+            # the pages after it were already covered by earlier checks
+            readers &= known if resuming else following
+            if not readers or not current.next_url:
+                break
+            if fetched >= SEARCH_MAX_PAGES:
+                # Come back for the rest only while the crawl is still finding new ads
+                complete = not following
+                logger.info(f"Stopped after {fetched} pages for {url} (SEARCH_MAX_PAGES)")
+                break
+            current = await fetch_search_page(current.next_url)
+            if current is None:
+                complete = False
+                break
+            fetched += 1
+        
+        # Mark the ads as seen and queue their notifications atomically
+        async def mark_seen(session):
+            if new_rows:
+                await session.execute(insert(SeenAd), new_rows)
+            if outbox_rows:
+                await session.execute(insert(Outbox), outbox_rows)
+            # Only remember the fingerprint once the page's ads have been handled,
+            # and not if a handler invalidated it meanwhile (e.g. a new follower)
+            if await state_still_current(session, url, generation):
+                await save_search_state(session, url, page, complete)
+        
+        await db_writer.write(mark_seen)
+        if outbox_rows:
+            delivery_queue.notify()
+        return new_ads
+    except Exception as e:
+        logger.error(f"[ERROR] URL: {url} — {e}")
+        return None
+
+async def check_and_reschedule(url: str, entries: list[Watchlist], running: dict[str, bool], state: SearchState, schedule: SearchSchedule,
+                               scale: float = 1.0, generation: int = 0):
+    """Check a search and feed the outcome into its adaptive polling schedule."""
+    new_ads = await check_search(url, entries, running, state, generation)
+    if new_ads is not None:
+        new_ads_total.inc(new_ads, search=url)
+    if new_ads is None:
+        retry_later(schedule, scale=scale)
+    elif state is None or state.fingerprint is None:
+        # A first or resumed check delivers a backlog, not the ads listed since the last check
+        skip_learning(schedule, scale=scale)
+    else:
+        update_schedule(schedule, new_ads, scale=scale)
+    
+    await db_writer.write(lambda session: session.merge(schedule))
+
+async def check_due_search(url: str, leases: ShardLeases = None, scale: float = 1.0) -> Optional[float]:
+    """Check one due search; returns when it is due next, or None if nobody follows it anymore
+    (or, when sharded, its shard moved to another worker). `scale` is the request budget's
+    stretch of the learned intervals."""
+    if leases and not leases.owns(url):
+        return None
+    entries = registry.entries_for_url(url)
+    if not entries:
+        return None
+    running = {entry.chat_id: registry.is_running(entry.chat_id) for entry in entries}
+    generation = registry.state_generation(url)
+    async with AsyncSessionLocal() as session:
+        state = await session.get(SearchState, url)
+        schedule = await session.get(SearchSchedule, url) or new_schedule(url)
+    
+    await check_and_reschedule(url, entries, running, state, schedule, scale, generation)
+    return schedule.next_due_at
+
+async def load_search_schedules(urls: list[str]) -> dict[str, tuple[float, float]]:
+    """Stored (next-due time, learned interval) of the followed searches (drops state of unfollowed ones)."""
+    await db_writer.write(lambda session: drop_orphaned_searches(session, urls))
+    async with AsyncSessionLocal() as session:
+        rows = await session.execute(select(SearchSchedule.url, SearchSchedule.next_due_at, SearchSchedule.interval))
+        return {url: (next_due_at, interval) for url, next_due_at, interval in rows}
+
+def search_budget_scale(urls: list[str], schedules: dict[str, tuple[float, float]], check_interval: int) -> float:
+    """Budget scale for the learned intervals of `urls`; never checked ones count at their starting interval."""
+    return budget_scale([schedules[url][1] if url in schedules else START_INTERVAL for url in urls], check_interval)
+
+def sync_due_queue(urls: list[str], schedules: dict[str, tuple[float, float]], spread: float):
+    """Add followed searches missing from the due queue and drop unfollowed ones.
+    
+    Searches that were never checked are due right away. Overdue ones (e.g.
+    after a restart) are spread over the next `spread` seconds instead of all
+    firing at once.
+    """
+    now = time.time()
+    for url in urls:
+        if url in due_queue:
+            continue
+        due_at = schedules[url][0] if url in schedules else now
+        if url in schedules and due_at <= now:
+            due_at = now + random.uniform(0, spread)
+        due_queue.schedule(url, due_at)
+    due_queue.retain(urls)
+
+async def check_for_new_ads(check_interval: int, leases: ShardLeases = None):
+    """Continuously dispatch due searches to a bounded pool of workers.
+    
+    Each distinct search URL has its own next-due time in the due queue, so
+    checks are spread over time instead of sweeping the whole watchlist at
+    once. Handlers push new URLs to the front of the queue; the watchlist is
+    also re-synced every check_interval to pick up any other changes.
+    
+    The followed searches and chats come from the in-memory registry. With
+    `leases` (worker mode) only the searches in this worker's shards are
+    checked, and the leases are refreshed, the registry reloaded and the queue
+    re-synced every third of the lease TTL.
+    
+    Every sync also refits the request budget scale (see polling.budget_scale)
+    so the searches checked here stay within one request per check_interval
+    each, however busy some of them are.
+    """
+    workers = asyncio.Semaphore(SCRAPE_WORKERS)
+    sync_interval = min(check_interval, leases.ttl / 3) if leases else check_interval
+    checks = 0
+    scale = 1.0
+    last_checked: dict[str, float] = {}
+    check_interval_seconds.set(check_interval)
+    
+    async def run(url: str):
+        nonlocal checks
+        next_due = time.time() + check_interval
+        try:
+            started_at = time.time()
+            with check_seconds.time():
+                next_due = await check_due_search(url, leases, scale)
+            checks += 1
+            if url in last_checked:
+                cycle_seconds.observe(started_at - last_checked[url])
+            last_checked[url] = started_at
+        except Exception as e:
+            logger.error(f"[ERROR] URL: {url} — {e}")
+        finally:
+            due_queue.done(url, next_due)
+            workers.release()
+    
+    async def sync_watchlist():
+        nonlocal checks, scale
+        logged_at = time.time()
+        while True:
+            try:
+                if leases:
+                    # Handlers run in the front-end process, pick up their changes
+                    await registry.load()
+                urls = registry.urls()
+                schedules = await load_search_schedules(urls)
+                if leases:
+                    await asyncio.to_thread(leases.refresh)
+                    urls = [url for url in urls if leases.owns(url)]
+                sync_due_queue(urls, schedules, min(MIN_CHECK_INTERVAL, check_interval))
+                scale = search_budget_scale(urls, schedules, check_interval)
+                # Forget the searches nobody follows anymore
+                new_ads_total.retain("search", urls)
+                for url in set(last_checked) - set(urls):
+                    del last_checked[url]
+                if time.time() - logged_at >= check_interval:
+                    stats = detail_cache.stats()
+                    writes = db_writer.stats()
+                    logger.info(f"Checked {checks} searches in the last {check_interval}s, following {len(urls)} searches, {len(due_queue)} queued, "
+                                f"intervals stretched x{scale:.2f} to stay within the request budget")
+                    logger.info(f"Detail cache: {stats['size']} entries, {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+                    logger.info(f"Database writes: {writes['writes']} in {writes['batches']} batches, {writes['failed']} failed, {writes['pending']} pending, "
+                                f"latency p50 {writes['p50_ms']:.0f}ms p99 {writes['p99_ms']:.0f}ms max {writes['max_ms']:.0f}ms")
+                    checks = 0
+                    logged_at = time.time()
             except Exception as e:
-                logger.error(f"[ERROR] URL: {entry.url} — {e}")
-        session.close()
-        await asyncio.sleep(check_interval)
\ No newline at end of file
+                logger.error(f"[ERROR] Failed to sync the watchlist: {e}")
+            await asyncio.sleep(sync_interval)
+    
+    sync_task = asyncio.create_task(sync_watchlist())
+    try:
+        while True:
+            await workers.acquire()
+            url = await due_queue.pop_due()
+            asyncio.create_task(run(url))
+    finally:
+        sync_task.cancel()
+
+async def resolve_titles(urls: list[str]):
+    """Fetch the titles of newly added searches concurrently and fill in their watchlist entries."""
+    titles = await asyncio.gather(*(get_title_from_url(url) for url in urls))
+    async def save_titles(session):
+        for url, title in zip(urls, titles):
+            await session.execute(
+                update(Watchlist).where(Watchlist.url == url, Watchlist.title.is_(None)).values(title=title)
+            )
+    
+    try:
+        await db_writer.write(save_titles)
+        for url, title in zip(urls, titles):
+            registry.set_title(url, title)
+    except Exception as e:
+        logger.error(f"[ERROR] Failed to save watchlist titles: {e}")
+
+async def purge_old_seen_ads(interval: int):
+    """Periodically drop seen ads past the retention window."""
+    while True:
+        try:
+            deleted = await db_writer.write(lambda session: purge_seen_ads(session, SEEN_AD_RETENTION_DAYS))
+            if deleted:
+                logger.info(f"Purged {deleted} seen ads older than {SEEN_AD_RETENTION_DAYS} days")
+                await asyncio.to_thread(compact_database)
+        except Exception as e:
+            logger.error(f"[ERROR] Failed to purge seen ads: {e}")
+        await asyncio.sleep(interval)
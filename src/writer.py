@@ -0,0 +1,160 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from config import WRITE_FLUSH_INTERVAL, WRITE_BATCH_SIZE
+from metrics import db_write_seconds, db_writes_total, queue_depth, stage_seconds
+
+logger = logging.getLogger(__name__)
+
+# A write intent applies its changes to the session it is given; the writer
+# commits it. It may be re-run alone if another intent of its batch fails, so
+# it must not touch outside state.
+WriteIntent = Callable[[AsyncSession], Awaitable[Any]]
+
+LATENCY_SAMPLES = 1000  # Recent write latencies kept for the percentiles in stats()
+
+class WriteQueue:
+    """Single database writer for the event loop, committing write intents in batches.
+
+    Handlers, the monitor and the delivery worker hand their writes (seen
+    ads, watchlist changes, bot state, outbox rounds, retention purges, ...)
+    to `write` instead of opening their own transactions. The writer
+    collects intents for up to `flush_interval` seconds or `batch_size`
+    intents and commits them in one short transaction, so SQLite sees one
+    writer doing few commits instead of many sessions competing for the lock.
+
+    Each intent is flushed on its own so a failing one is identified; the
+    batch is then rolled back and its intents committed one by one, and only
+    the failing intent's caller gets the error.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.writes = 0
+        self.failed = 0
+        self.batches = 0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, intent: WriteIntent) -> asyncio.Future:
+        """Queue a write; the returned future resolves with the intent's result once committed."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((intent, future, time.perf_counter()))
+        return future
+
+    async def write(self, intent: WriteIntent) -> Any:
+        """Queue a write and wait until it is committed."""
+        return await self.submit(intent)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def _apply(self, batch: list) -> bool:
+        """Run the batch's intents in one transaction; False if one of them failed."""
+        results = []
+        started_at = time.perf_counter()
+        async with AsyncSessionLocal() as session:
+            try:
+                for intent, _, _ in batch:
+                    results.append(await intent(session))
+                    await session.flush()
+                    # Don't let one intent's loaded objects leak into the next
+                    session.expunge_all()
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                if len(batch) == 1:
+                    # The caller may have given up on it (cancelled) meanwhile
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                    self.failed += 1
+                return False
+
+        committed_at = time.perf_counter()
+        stage_seconds.observe(committed_at - started_at, stage="db")
+        for (_, future, queued_at), result in zip(batch, results):
+            self._latencies.append(committed_at - queued_at)
+            db_write_seconds.observe(committed_at - queued_at)
+            if not future.done():
+                future.set_result(result)
+        self.writes += len(batch)
+        self.batches += 1
+        return True
+
+    async def _commit(self, batch: list):
+        try:
+            if await self._apply(batch) or len(batch) == 1:
+                return
+            logger.warning(f"A write in a batch of {len(batch)} failed, committing them one by one")
+            for item in batch:
+                await self._apply([item])
+        except Exception as e:
+            logger.error(f"[ERROR] Database write failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _next_batch(self) -> Optional[list]:
+        """Wait for a write, then gather more for up to flush_interval. None once closed."""
+        first = await self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                # Closing: put the marker back for the next round
+                self._queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    async def run(self):
+        while (batch := await self._next_batch()) is not None:
+            await self._commit(batch)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        """Commit everything queued so far and stop the writer."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+        return {
+            "writes": self.writes,
+            "failed": self.failed,
+            "batches": self.batches,
+            "pending": self.pending(),
+            "avg_batch": self.writes / self.batches if self.batches else 0.0,
+            "p50_ms": percentile(0.5) * 1000,
+            "p99_ms": percentile(0.99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        }
+
+# Global database writer, started alongside the bot or worker
+db_writer = WriteQueue(WRITE_FLUSH_INTERVAL, WRITE_BATCH_SIZE)
+queue_depth.track(db_writer.pending, queue="db_writes")
+db_writes_total.track(lambda: db_writer.writes, result="committed")
+db_writes_total.track(lambda: db_writer.failed, result="failed")
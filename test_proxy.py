@@ -3,6 +3,7 @@
 Test script to verify proxy integration with MercadoLibre scraper.
 """
 
+import asyncio
 import logging
 import sys
 import os
@@ -23,6 +24,9 @@ def test_proxy_connection():
     """Test if proxy connection is working."""
     print("Testing proxy connection...")
     
+    # Populate the scored proxy pool before making requests
+    asyncio.run(proxy_manager.check_proxies())
+    
     # Test with a simple URL
     test_url = "https://httpbin.org/ip"
     response = proxy_manager.make_request_with_proxy(test_url)
@@ -5,6 +5,7 @@ Test script to demonstrate different security modes with proxy configuration.
 
 import os
 import sys
+import asyncio
 import logging
 
 # Add src to path
@@ -34,6 +35,9 @@ def test_security_mode(use_proxy, proxy_fallback, mode_name):
     # Create new proxy manager instance
     pm = proxy_manager.ProxyManager()
     
+    # Populate the scored proxy pool before making requests
+    asyncio.run(pm.check_proxies())
+    
     # Test configuration
     print(f"USE_PROXY: {pm.use_proxy}")
     print(f"PROXY_FALLBACK: {pm.proxy_fallback}")
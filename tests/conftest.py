@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the bot at a throwaway database before any src module reads the configuration
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import async_engine
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop, then drop the pooled async connections bound to it."""
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time(): starts at a fixed instant, move it with `clock.advance(seconds)`."""
+    class Clock:
+        now = 1_700_000_000.0
+
+        def advance(self, seconds: float):
+            self.now += seconds
+
+    clock = Clock()
+    monkeypatch.setattr("time.time", lambda: clock.now)
+    return clock
@@ -0,0 +1,76 @@
+from circuit_breaker import BreakerRegistry, CircuitBreaker, TRIAL_TIMEOUT
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, base_backoff=10, max_backoff=100)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, base_backoff=10, max_backoff=100)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.ready() and not breaker.allow()
+
+def test_half_open_lets_a_single_trial_through(clock):
+    breaker = open_breaker()
+    clock.advance(10)
+    assert breaker.state == "half-open"
+    assert breaker.ready()
+    assert breaker.allow()
+    assert not breaker.ready() and not breaker.allow()
+
+def test_trial_that_never_reports_back_expires(clock):
+    breaker = open_breaker()
+    clock.advance(10)
+    assert breaker.allow()
+    clock.advance(TRIAL_TIMEOUT - 1)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+def test_released_trial_can_be_claimed_again(clock):
+    breaker = open_breaker()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+def test_successful_trial_closes_the_circuit(clock):
+    breaker = open_breaker()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+def test_failed_trial_reopens_for_longer(clock):
+    breaker = open_breaker()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    # The backoff doubled (jittered between half and full), and the trial slot is free once it elapses
+    assert 10 <= breaker.remaining() <= 20
+    clock.advance(20)
+    assert breaker.allow()
+
+def test_retry_after_opens_for_exactly_that_long(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, base_backoff=10, max_backoff=100)
+    breaker.record_failure(retry_after=42)
+    assert breaker.remaining() == 42
+    clock.advance(42)
+    assert breaker.allow()
+
+def test_registry_drops_breakers_of_unlisted_proxies():
+    registry = BreakerRegistry()
+    kept = registry.for_proxy("http://10.0.0.1:8080")
+    registry.for_proxy("http://10.0.0.2:8080")
+    host = registry.for_host("https://autos.mercadolibre.com.ar/search")
+    registry.retain_proxies(["http://10.0.0.1:8080"])
+    assert set(registry.all()) == {"proxy:http://10.0.0.1:8080", "host:autos.mercadolibre.com.ar"}
+    assert registry.for_proxy("http://10.0.0.1:8080") is kept
+    assert registry.for_host("https://autos.mercadolibre.com.ar/") is host
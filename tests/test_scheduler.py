@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from scheduler import DueQueue
+
+async def pop_or_none(queue: DueQueue, timeout: float = 0.05):
+    try:
+        return await asyncio.wait_for(queue.pop_due(), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+def test_pops_keys_in_due_order(run):
+    async def scenario():
+        queue = DueQueue()
+        now = time.time()
+        queue.schedule("b", now - 1)
+        queue.schedule("a", now - 2)
+        queue.schedule("later", now + 3600)
+        return [await pop_or_none(queue) for _ in range(3)]
+
+    assert run(scenario()) == ["a", "b", None]
+
+def test_schedule_keeps_the_earlier_due_time(run):
+    async def scenario():
+        queue = DueQueue()
+        now = time.time()
+        queue.schedule("a", now + 3600)
+        queue.schedule("a", now - 1)
+        queue.schedule("a", now + 7200)
+        return await pop_or_none(queue), len(queue)
+
+    assert run(scenario()) == ("a", 0)
+
+def test_running_key_is_not_handed_out_twice(run):
+    async def scenario():
+        queue = DueQueue()
+        queue.schedule_now("a")
+        key = await pop_or_none(queue)
+        # Rescheduled while its check runs: held back until done()
+        queue.schedule_now("a")
+        assert "a" in queue
+        assert await pop_or_none(queue) is None
+        # The pending due time wins over the later one the check reports
+        queue.done("a", time.time() + 3600)
+        return key, await pop_or_none(queue)
+
+    assert run(scenario()) == ("a", "a")
+
+def test_done_with_none_drops_the_key(run):
+    async def scenario():
+        queue = DueQueue()
+        queue.schedule_now("a")
+        await pop_or_none(queue)
+        queue.done("a", None)
+        return "a" in queue, await pop_or_none(queue)
+
+    assert run(scenario()) == (False, None)
+
+def test_retain_discards_other_keys(run):
+    async def scenario():
+        queue = DueQueue()
+        queue.schedule_now("a")
+        queue.schedule_now("b")
+        queue.retain(["a"])
+        return len(queue), await pop_or_none(queue), await pop_or_none(queue)
+
+    assert run(scenario()) == (1, "a", None)
+
+def test_scheduling_wakes_a_waiting_pop(run):
+    async def scenario():
+        queue = DueQueue()
+        queue.schedule("a", time.time() + 3600)
+        waiter = asyncio.create_task(queue.pop_due())
+        await asyncio.sleep(0.01)
+        queue.schedule_now("b")
+        return await asyncio.wait_for(waiter, 1)
+
+    assert run(scenario()) == "b"
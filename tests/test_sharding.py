@@ -0,0 +1,47 @@
+import pytest
+
+from database import SessionLocal, ShardLease, WorkerHeartbeat
+from sharding import ShardLeases
+
+SHARDS = 4
+TTL = 60
+
+@pytest.fixture(autouse=True)
+def empty_leases():
+    with SessionLocal() as session:
+        session.query(ShardLease).delete()
+        session.query(WorkerHeartbeat).delete()
+        session.commit()
+
+def leases(worker_id: str) -> ShardLeases:
+    return ShardLeases(worker_id=worker_id, shard_count=SHARDS, ttl=TTL)
+
+def test_single_worker_owns_every_shard(clock):
+    assert leases("a").refresh() == {0, 1, 2, 3}
+
+def test_new_worker_gets_its_share_once_released(clock):
+    a, b = leases("a"), leases("b")
+    a.refresh()
+    # Everything is still leased to a: b has to wait for a to give shards back
+    assert b.refresh() == set()
+    assert a.refresh() == {0, 1}
+    assert b.refresh() == {2, 3}
+    assert a.refresh() == {0, 1}
+
+def test_silent_worker_shards_are_taken_over(clock):
+    a, b = leases("a"), leases("b")
+    a.refresh()
+    b.refresh()
+    a.refresh()
+    b.refresh()
+    # a stops renewing: its heartbeat and leases expire
+    clock.advance(TTL + 1)
+    assert b.refresh() == {0, 1, 2, 3}
+
+def test_released_shards_are_claimed_right_away(clock):
+    a, b = leases("a"), leases("b")
+    a.refresh()
+    b.refresh()
+    a.release()
+    assert a.owned == set()
+    assert b.refresh() == {0, 1, 2, 3}
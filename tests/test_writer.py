@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import AsyncSessionLocal, SessionLocal, Watchlist
+from writer import WriteQueue
+
+def add_entry(chat_id: str, url: str):
+    async def intent(session):
+        session.add(Watchlist(chat_id=chat_id, url=url))
+        return chat_id
+    return intent
+
+def seed_entry(chat_id: str, url: str):
+    with SessionLocal() as session:
+        session.add(Watchlist(chat_id=chat_id, url=url))
+        session.commit()
+
+async def stored_chats(url: str) -> set:
+    async with AsyncSessionLocal() as session:
+        return set(await session.scalars(select(Watchlist.chat_id).where(Watchlist.url == url)))
+
+def test_failed_batch_is_committed_one_by_one(run):
+    seed_entry("1", "https://example.com/batch")
+
+    async def scenario():
+        writer = WriteQueue(flush_interval=0.05, batch_size=10)
+        # Queued before the writer runs, so all three land in one batch; the middle one is a duplicate
+        futures = [writer.submit(add_entry(chat_id, "https://example.com/batch")) for chat_id in ("2", "1", "3")]
+        writer.start()
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await writer.close()
+        return writer, results, await stored_chats("https://example.com/batch")
+
+    writer, results, chats = run(scenario())
+    assert results[0] == "2" and results[2] == "3"
+    assert isinstance(results[1], IntegrityError)
+    assert chats == {"1", "2", "3"}
+    assert writer.failed == 1
+
+def test_write_before_start_waits_for_writer(run):
+    async def scenario():
+        writer = WriteQueue(flush_interval=0.0, batch_size=10)
+        future = writer.submit(add_entry("1", "https://example.com/later"))
+        await asyncio.sleep(0.05)
+        assert not future.done()
+        writer.start()
+        result = await future
+        await writer.close()
+        return result
+
+    assert run(scenario()) == "1"
+
+def test_cancelled_failing_write_is_not_reported(run, caplog):
+    seed_entry("1", "https://example.com/cancel")
+
+    async def scenario():
+        writer = WriteQueue(flush_interval=0.0, batch_size=10)
+        failing = writer.submit(add_entry("1", "https://example.com/cancel"))
+        failing.cancel()
+        writer.start()
+        # The writer keeps going after the cancelled write failed
+        result = await writer.write(add_entry("2", "https://example.com/cancel"))
+        await writer.close()
+        return writer, result
+
+    with caplog.at_level(logging.ERROR, logger="writer"):
+        writer, result = run(scenario())
+    assert result == "2"
+    assert writer.failed == 1
+    assert "Database write failed" not in caplog.text
+
+def test_failing_write_raises_for_its_caller(run):
+    seed_entry("1", "https://example.com/single")
+
+    async def scenario():
+        writer = WriteQueue(flush_interval=0.0, batch_size=10)
+        writer.start()
+        try:
+            with pytest.raises(IntegrityError):
+                await writer.write(add_entry("1", "https://example.com/single"))
+        finally:
+            await writer.close()
+
+    run(scenario())